@@ -0,0 +1,73 @@
+"""
+Hit rate of the result cache's eviction and admission policies on a replayed
+call trace, at a fixed cache size.
+
+Run from the python/ directory:
+    python benchmarks/bench_cache.py [cache_entries] [trace_file]
+
+The trace file has one call key per line, optionally followed by a space and
+the call's cost. Without one, a synthetic trace is generated: Zipf-distributed
+reuse of a set of hot prompts, interleaved with a larger stream of calls made
+only once (the pattern of evaluation jobs and fan-out agents).
+"""
+
+import random
+import sys
+import time
+
+from gardefou import ResultCache
+
+
+def synthetic_trace(length=200_000, hot=20_000, one_off_share=0.5, seed=1):
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(hot)]
+    hot_keys = rng.choices(range(hot), weights=weights, k=length)
+    trace = []
+    one_off = 0
+    for key in hot_keys:
+        if rng.random() < one_off_share:
+            one_off += 1
+            trace.append((f"once-{one_off}", 0.0001))
+        # long-context completions are rarer and far more expensive
+        cost = 0.4 if key % 10 == 0 else 0.002
+        trace.append((f"hot-{key}", cost))
+    return trace
+
+
+def load_trace(path):
+    trace = []
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if parts:
+                trace.append((parts[0], float(parts[1]) if len(parts) > 1 else 1.0))
+    return trace
+
+
+def replay(trace, cache):
+    start = time.perf_counter()
+    for key, cost in trace:
+        hit, _ = cache.lookup(key)
+        if not hit:
+            cache.put(key, key, cost=cost)
+    elapsed = time.perf_counter() - start
+    return cache.stats(), elapsed
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    trace = load_trace(sys.argv[2]) if len(sys.argv) > 2 else synthetic_trace()
+    print(f"{len(trace):,} calls, cache of {entries:,} entries")
+    for policy, admission in (("lru", None), ("lru", "tinylfu"), ("gds", None), ("gds", "tinylfu")):
+        cache = ResultCache(max_entries=entries, policy=policy, admission=admission, sizeof=lambda value: 1)
+        stats, elapsed = replay(trace, cache)
+        name = policy + (f"+{admission}" if admission else "")
+        print(
+            f"  {name:<12} hit rate {stats['cache_hit_rate']:6.1%}   "
+            f"saved ${stats['cache_cost_saved']:10,.2f}   "
+            f"{len(trace) / elapsed:10,.0f} calls/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Throughput of guarded calls from many threads, with one lock vs sharded locks.
+
+Run from the python/ directory:
+    python benchmarks/bench_contention.py [threads] [calls_per_thread]
+
+Try it on a free-threaded build (python3.13t) too: with the GIL enabled the
+threads are serialized by the interpreter anyway and sharding mostly shows
+that it adds no overhead.
+"""
+
+import sys
+import threading
+import time
+
+from gardefou import GardeFou, Profile
+
+
+def noop(*args, **kwargs):
+    return None
+
+
+def run(threads, calls, shards):
+    profile = Profile(
+        config={
+            "max_calls": threads * calls,
+            "on_violation_duplicate_call": "warn",
+            "duplicate_shards": shards,
+        }
+    )
+    guard = GardeFou(profile=profile)
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(tid):
+        barrier.wait()
+        for i in range(calls):
+            guard(noop, tid, i)
+
+    workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    assert profile.call_count == threads * calls
+    return threads * calls / elapsed
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    calls = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"{threads} threads x {calls} calls, Python {sys.version.split()[0]}, GIL {'on' if gil else 'off'}")
+    for shards in (1, 4, 16, 64):
+        rate = run(threads, calls, shards)
+        print(f"  shards={shards:>3}: {rate:12,.0f} calls/s")
+
+
+if __name__ == "__main__":
+    main()
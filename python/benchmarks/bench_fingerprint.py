@@ -0,0 +1,55 @@
+"""
+Compare the old repr-tuple signatures with digest fingerprints.
+
+Run from the python/ directory:
+    python benchmarks/bench_fingerprint.py [n_calls] [prompt_kb]
+
+Reports the memory retained by the signature set and the mean latency of
+building one signature for prompts of the given size.
+"""
+
+import sys
+import time
+import tracemalloc
+
+from gardefou.fingerprint import HASH_ALGORITHM, fingerprint
+
+
+def repr_signature(fn_name, args, kwargs):
+    # The signature Profile._check_duplicate used to keep
+    return (fn_name, repr(args), repr(sorted(kwargs.items())))
+
+
+def make_calls(n, prompt_kb):
+    filler = "lorem ipsum dolor sit amet " * (prompt_kb * 1024 // 27)
+    return [((f"prompt {i}: {filler}",), {"model": "gpt-4", "temperature": 0.2}) for i in range(n)]
+
+
+def measure(build, calls):
+    tracemalloc.start()
+    store = set()
+    start = time.perf_counter()
+    for args, kwargs in calls:
+        store.add(build("generate", args, kwargs))
+    elapsed = time.perf_counter() - start
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return retained, elapsed / len(calls)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    prompt_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    calls = make_calls(n, prompt_kb)
+
+    print(f"{n} calls, {prompt_kb} KB prompts, digest={HASH_ALGORITHM}")
+    for label, build in (("repr", repr_signature), ("digest", fingerprint)):
+        retained, latency = measure(build, calls)
+        print(
+            f"  {label:>6}: {retained / 1024 / 1024:8.2f} MiB retained, "
+            f"{retained / n:10.0f} B/call, {latency * 1e6:8.1f} us/call"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Per-call overhead of the guard: a bare call, the old passthrough (check the
+profile, then call fn directly) and the guarded call, which wraps the call
+to record how it ends.
+
+Run from the python/ directory:
+    python benchmarks/bench_overhead.py [calls]
+"""
+
+import asyncio
+import sys
+import time
+
+from gardefou import GardeFou, Profile
+
+
+def noop(i):
+    return i
+
+
+async def anoop(i):
+    return i
+
+
+def per_call(elapsed, calls):
+    return elapsed / calls * 1e6
+
+
+def bench_sync(calls):
+    profile = Profile(max_calls=calls * 3, on_violation_duplicate_call="warn")
+    guard = GardeFou(profile=profile)
+    timings = {}
+
+    start = time.perf_counter()
+    for i in range(calls):
+        noop(i)
+    timings["bare call"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(calls):
+        profile.check("noop", (i,), {}, fn=noop)
+        noop(i)
+    timings["check + call"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(calls):
+        guard(noop, calls + i)
+    timings["guard(fn)"] = time.perf_counter() - start
+    return timings
+
+
+async def bench_async(calls):
+    profile = Profile(max_calls=calls * 3, on_violation_duplicate_call="warn")
+    guard = GardeFou(profile=profile)
+    timings = {}
+
+    start = time.perf_counter()
+    for i in range(calls):
+        await anoop(i)
+    timings["bare await"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(calls):
+        profile.check("anoop", (i,), {}, fn=anoop, block=False)
+        await anoop(i)
+    timings["check + await (passthrough)"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(calls):
+        await guard(anoop, calls + i)
+    timings["await guard(fn) (wrapped)"] = time.perf_counter() - start
+    assert profile.completed_count == calls
+    return timings
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"{calls:,} calls, Python {sys.version.split()[0]}")
+    for title, timings in (("sync", bench_sync(calls)), ("async", asyncio.run(bench_async(calls)))):
+        print(f"  {title}:")
+        for name, elapsed in timings.items():
+            print(f"    {name:<28} {per_call(elapsed, calls):8.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
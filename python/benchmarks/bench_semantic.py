@@ -0,0 +1,39 @@
+"""
+Lookup latency of the semantic result cache as it grows.
+
+Run from the python/ directory (needs numpy):
+    python benchmarks/bench_semantic.py [dimensions] [sizes...]
+
+e.g. `python benchmarks/bench_semantic.py 384 10000 100000 1000000`. The
+matrix takes sizes x dimensions x 4 bytes (1.5 GB for 1M x 384).
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from gardefou import SemanticCache
+
+
+def main():
+    dims = int(sys.argv[1]) if len(sys.argv) > 1 else 384
+    sizes = [int(n) for n in sys.argv[2:]] or [10_000, 100_000, 1_000_000]
+    rng = np.random.default_rng(0)
+    print(f"{dims}-dimensional embeddings")
+    for size in sizes:
+        cache = SemanticCache(lambda vector: vector, max_entries=None, initial_capacity=size)
+        for start in range(0, size, 10_000):
+            block = rng.standard_normal((min(10_000, size - start), dims), dtype=np.float32)
+            for vector in block:
+                cache.put("chat", cache.embed(vector), None)
+        queries = [cache.embed(q) for q in rng.standard_normal((50, dims), dtype=np.float32)]
+        start = time.perf_counter()
+        for query in queries:
+            cache.lookup("chat", query)
+        elapsed = (time.perf_counter() - start) / len(queries)
+        print(f"  {size:>10,} entries: {elapsed * 1000:8.2f} ms/lookup, {size * dims * 4 / 2**20:8.0f} MiB")
+
+
+if __name__ == "__main__":
+    main()
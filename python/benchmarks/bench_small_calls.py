@@ -0,0 +1,65 @@
+"""
+Compare repr-tuple signatures with digest fingerprints on typical small
+calls: a couple of scalar arguments, a short chat transcript, and a guarded
+call with duplicate detection on.
+
+Run from the python/ directory:
+    python benchmarks/bench_small_calls.py [calls]
+"""
+
+import sys
+import time
+
+from gardefou import GardeFou, Profile
+from gardefou.fingerprint import HASH_ALGORITHM, fingerprint
+
+
+def repr_signature(fn_name, args, kwargs):
+    # The signature Profile._check_duplicate used to keep
+    return (fn_name, repr(args), repr(sorted(kwargs.items())))
+
+
+def chat(i):
+    messages = [
+        {"role": "user" if turn % 2 else "assistant", "content": f"message {turn} of chat {i}"}
+        for turn in range(20)
+    ]
+    return (messages,), {"model": "gpt-4", "temperature": 0.2}
+
+
+def noop(*args, **kwargs):
+    return None
+
+
+def per_call(build, calls):
+    start = time.perf_counter()
+    for args, kwargs in calls:
+        build("generate", args, kwargs)
+    return (time.perf_counter() - start) / len(calls) * 1e6
+
+
+def guarded(calls):
+    guard = GardeFou(profile=Profile(on_violation_duplicate_call="warn"))
+    start = time.perf_counter()
+    for args, kwargs in calls:
+        guard(noop, *args, **kwargs)
+    return (time.perf_counter() - start) / len(calls) * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    workloads = {
+        "(i, 'hello')": [((i, "hello"), {}) for i in range(n)],
+        "20-message chat": [chat(i) for i in range(n // 10)],
+    }
+
+    print(f"{n:,} calls, digest={HASH_ALGORITHM}, Python {sys.version.split()[0]}")
+    for name, calls in workloads.items():
+        print(f"  {name}:")
+        print(f"    {'repr':<22} {per_call(repr_signature, calls):8.2f} us/call")
+        print(f"    {'digest':<22} {per_call(fingerprint, calls):8.2f} us/call")
+        print(f"    {'guarded, dedup on':<22} {guarded(calls):8.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,23 @@
 """gardefou package."""
 
 from .profile import Profile, QuotaExceededError
+from .cache import DiskCache, ResultCache
+from .fingerprint import register_fingerprinter
 from .gardefou import GardeFou
+from .ratelimit import RateLimiter
+from .semantic import SemanticCache
+from .storage import BloomSignatureStore, SignatureStore, WindowedSignatureStore
 
-__all__ = ["Profile", "GardeFou", "QuotaExceededError"]
+__all__ = [
+    "Profile",
+    "GardeFou",
+    "QuotaExceededError",
+    "SignatureStore",
+    "BloomSignatureStore",
+    "WindowedSignatureStore",
+    "ResultCache",
+    "DiskCache",
+    "SemanticCache",
+    "RateLimiter",
+    "register_fingerprinter",
+]
@@ -0,0 +1,607 @@
+"""Result caches used to answer duplicate calls without calling the API again."""
+
+import heapq
+import logging
+import mmap
+import os
+import pickle
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, Union
+
+from .fingerprint import HASH_ALGORITHM
+
+_MASK64 = (1 << 64) - 1
+
+# DiskCache entry layout: magic, pickle length, buffer count, then an
+# (offset, length) pair per out-of-band buffer, the pickle, and the buffers
+# themselves at BUFFER_ALIGNMENT-aligned offsets
+_ENTRY_MAGIC = b"GFC5"
+_ENTRY_HEADER = struct.Struct("<4sQQ")
+_BUFFER_SPAN = struct.Struct("<QQ")
+BUFFER_ALIGNMENT = 64
+
+
+def estimate_size(value: Any, _seen: Optional[set] = None) -> int:
+    """
+    Approximate bytes retained by `value`: sys.getsizeof summed over nested
+    lists, tuples, sets, dicts and instance __dict__s, counting shared
+    objects once.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+    size = sys.getsizeof(value, 64)
+    if isinstance(value, (str, bytes, bytearray, int, float, bool, type(None))):
+        return size
+    if isinstance(value, dict):
+        size += sum(estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, _seen) for item in value)
+    state = getattr(value, "__dict__", None)
+    if isinstance(state, dict):
+        size += estimate_size(state, _seen)
+    return size
+
+
+class _CountMinSketch:
+    """
+    Approximate access counts in a few KB: `depth` rows of 4-bit-style
+    counters (saturating at 15), the estimate being the smallest of a key's
+    counters. After 10 x width increments every counter is halved, so the
+    counts follow recent popularity rather than all-time totals.
+    """
+
+    SEEDS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93)
+    MAX_COUNT = 15
+    _HALVE = bytes(i >> 1 for i in range(256))
+
+    def __init__(self, width: int):
+        bits = max(4, (width - 1).bit_length())
+        self.width = 1 << bits
+        self._shift = 64 - bits
+        self._rows = [bytearray(self.width) for _ in self.SEEDS]
+        self._sample_size = 10 * self.width
+        self._additions = 0
+
+    def _indexes(self, key: Hashable) -> List[int]:
+        h = hash(key) & _MASK64
+        shift = self._shift
+        return [((h * seed) & _MASK64) >> shift for seed in self.SEEDS]
+
+    def increment(self, key: Hashable):
+        for row, i in zip(self._rows, self._indexes(key)):
+            if row[i] < self.MAX_COUNT:
+                row[i] += 1
+        self._additions += 1
+        if self._additions >= self._sample_size:
+            self._rows = [row.translate(self._HALVE) for row in self._rows]
+            self._additions //= 2
+
+    def estimate(self, key: Hashable) -> int:
+        return min(row[i] for row, i in zip(self._rows, self._indexes(key)))
+
+
+class ResultCache:
+    """
+    Thread-safe in-memory cache of call results keyed by call signature.
+
+    Entries are evicted beyond `max_entries` entries or `max_bytes`
+    (estimated with estimate_size), and expire `ttl` seconds after they were
+    stored. Every limit is optional. The eviction `policy` is one of:
+      - "lru": least recently used first
+      - "gds": GreedyDual-Size, lowest cost saved per byte retained first.
+               An entry's priority is L + cost / size, where L is the
+               priority of the last evicted entry, so entries that are not
+               hit again age out even when they were expensive.
+
+    With admission="tinylfu" (W-TinyLFU) new results first go to a small LRU
+    window (1% of the limits). A result pushed out of the window only enters
+    the main cache if a count-min sketch of recent lookups says it is asked
+    for more often than the entry it would evict, so a stream of one-off
+    calls cannot flush results that keep being reused. Requires a limit.
+
+    Each entry carries the `cost` of the call that produced it (1 unless
+    given), and stats() reports the total cost saved by hits.
+    """
+
+    POLICIES = ("lru", "gds")
+    ADMISSIONS = (None, "tinylfu")
+    WINDOW_RATIO = 0.01
+    # sketch width per entry when only max_bytes bounds the cache
+    DEFAULT_SKETCH_WIDTH = 1 << 16
+    # budget Profile gives the cache when no limit is configured
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+    def __init__(
+        self,
+        *,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        policy: str = "lru",
+        admission: Optional[str] = None,
+        sizeof: Callable[[Any], int] = estimate_size,
+        clock: Optional[Callable[[], float]] = None,
+    ):
+        if policy not in self.POLICIES:
+            raise ValueError(f"policy must be 'lru' or 'gds', got {policy!r}")
+        if admission not in self.ADMISSIONS:
+            raise ValueError(f"admission must be None or 'tinylfu', got {admission!r}")
+        if admission is not None and max_entries is None and max_bytes is None:
+            raise ValueError("admission='tinylfu' requires max_entries or max_bytes")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.policy = policy
+        self.admission = admission
+        self._sizeof = sizeof
+        self._clock = clock or time.monotonic
+        self._lock = threading.Lock()
+
+        # key -> (value, expires_at, size, cost, stored_at), in recency order for "lru"
+        self._entries: "OrderedDict[Hashable, Tuple[Any, Optional[float], int, float, float]]" = OrderedDict()
+        self._bytes = 0
+        # "gds" bookkeeping: key -> its current (priority, seq) record, a heap
+        # of (priority, seq, key) holding superseded records until they
+        # surface, and the inflation value L
+        self._priority: Dict[Hashable, Tuple[float, int]] = {}
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._seq = 0
+        self._inflation = 0.0
+
+        # "tinylfu": admission window in front of the main cache, whose limits
+        # shrink by the window's share
+        self._sketch: Optional[_CountMinSketch] = None
+        self._window: "OrderedDict[Hashable, Tuple[Any, Optional[float], int, float, float]]" = OrderedDict()
+        self._window_bytes = 0
+        self._window_entries = self._window_max_bytes = None
+        self._main_entries, self._main_bytes = max_entries, max_bytes
+        if admission == "tinylfu":
+            self._sketch = _CountMinSketch(max_entries or self.DEFAULT_SKETCH_WIDTH)
+            if max_entries is not None:
+                self._window_entries = max(1, int(max_entries * self.WINDOW_RATIO))
+                self._main_entries = max(1, max_entries - self._window_entries)
+            if max_bytes is not None:
+                self._window_max_bytes = max(1, int(max_bytes * self.WINDOW_RATIO))
+                self._main_bytes = max(1, max_bytes - self._window_max_bytes)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejections = 0
+        self.cost_saved = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries) + len(self._window)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached result for `key`, or `default`."""
+        hit, value = self.lookup(key)
+        return value if hit else default
+
+    def lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        """Return (True, cached result) for `key`, or (False, None) on a miss."""
+        with self._lock:
+            if self._sketch is not None:
+                self._sketch.increment(key)
+            entry = self._window.get(key)
+            region = self._window
+            if entry is None:
+                entry = self._entries.get(key)
+                region = self._entries
+            if entry is not None and entry[1] is not None and entry[1] <= self._clock():
+                self._discard(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            if region is self._window:
+                self._window.move_to_end(key)
+            else:
+                self._touch(key, entry)
+            self.hits += 1
+            self.cost_saved += entry[3]
+            return True, entry[0]
+
+    def put(self, key: Hashable, value: Any, cost: float = 1.0):
+        """Store `value` for `key`, produced by a call costing `cost`, evicting as needed."""
+        size = self._sizeof(value)
+        now = self._clock()
+        expires_at = now + self.ttl if self.ttl is not None else None
+        entry = (value, expires_at, size, cost, now)
+        with self._lock:
+            self._discard(key)
+            if self._sketch is None:
+                self._insert(key, entry)
+                while self._main_over_limit():
+                    self._evict(self._victim())
+                return
+            self._window[key] = entry
+            self._window_bytes += size
+            while self._window and (
+                (self._window_entries is not None and len(self._window) > self._window_entries)
+                or (self._window_max_bytes is not None and self._window_bytes > self._window_max_bytes)
+            ):
+                candidate, candidate_entry = self._window.popitem(last=False)
+                self._window_bytes -= candidate_entry[2]
+                self._admit(candidate, candidate_entry)
+
+    def age(self, key: Hashable) -> Optional[float]:
+        """Seconds since the result for `key` was stored, or None if it is not cached."""
+        with self._lock:
+            entry = self._window.get(key) or self._entries.get(key)
+            return None if entry is None else self._clock() - entry[4]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._window.clear()
+            self._window_bytes = 0
+            self._priority.clear()
+            self._heap.clear()
+            self._inflation = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        stats = {
+            "cache_entries": len(self),
+            "cache_bytes": self._bytes + self._window_bytes,
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "cache_hit_rate": self.hits / lookups if lookups else 0.0,
+            "cache_evictions": self.evictions,
+            "cache_expirations": self.expirations,
+            "cache_cost_saved": self.cost_saved,
+        }
+        if self._sketch is not None:
+            stats["cache_rejections"] = self.rejections
+        return stats
+
+    def _admit(self, key: Hashable, entry: tuple):
+        """
+        Move a result leaving the window into the main cache if it is looked
+        up more often than each entry it would push out; otherwise drop it.
+        """
+        self._insert(key, entry)
+        frequency = self._sketch.estimate(key)
+        while self._main_over_limit():
+            victim = self._victim()
+            if victim != key and frequency > self._sketch.estimate(victim):
+                self._evict(victim)
+            else:
+                self._remove(key)
+                self.rejections += 1
+                return
+
+    def _main_over_limit(self) -> bool:
+        return bool(self._entries) and (
+            (self._main_entries is not None and len(self._entries) > self._main_entries)
+            or (self._main_bytes is not None and self._bytes > self._main_bytes)
+        )
+
+    def _insert(self, key: Hashable, entry: tuple):
+        self._entries[key] = entry
+        self._bytes += entry[2]
+        self._touch(key, entry)
+
+    def _touch(self, key: Hashable, entry: tuple):
+        """Mark `key` as just used: most recent for "lru", re-prioritized for "gds"."""
+        if self.policy == "lru":
+            self._entries.move_to_end(key)
+            return
+        priority = self._inflation + entry[3] / max(1, entry[2])
+        self._seq += 1
+        self._priority[key] = (priority, self._seq)
+        heapq.heappush(self._heap, (priority, self._seq, key))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            # drop records superseded by later touches
+            self._heap = [(p, n, k) for p, n, k in self._heap if self._priority.get(k) == (p, n)]
+            heapq.heapify(self._heap)
+
+    def _victim(self) -> Hashable:
+        """The main-cache entry the policy would evict next (not removed)."""
+        if self.policy == "lru":
+            return next(iter(self._entries))
+        heap = self._heap
+        while self._priority.get(heap[0][2]) != heap[0][:2]:
+            heapq.heappop(heap)
+        return heap[0][2]
+
+    def _evict(self, key: Hashable):
+        if self.policy == "gds":
+            self._inflation = self._priority[key][0]
+        self._remove(key)
+        self.evictions += 1
+
+    def _discard(self, key: Hashable):
+        """Drop `key` from whichever region holds it."""
+        entry = self._window.pop(key, None)
+        if entry is not None:
+            self._window_bytes -= entry[2]
+        elif key in self._entries:
+            self._remove(key)
+
+    def _remove(self, key: Hashable):
+        size = self._entries.pop(key)[2]
+        self._bytes -= size
+        self._priority.pop(key, None)
+
+
+def _dump_entry(cost: float, value: Any) -> List[Any]:
+    """Chunks of the file storing (cost, value), see _ENTRY_HEADER."""
+    buffers: List[memoryview] = []
+
+    def out_of_band(buffer: pickle.PickleBuffer) -> bool:
+        try:
+            buffers.append(buffer.raw())
+        except BufferError:  # not contiguous: kept in the pickle
+            return True
+        return False
+
+    payload = pickle.dumps((cost, value), protocol=5, buffer_callback=out_of_band)
+    offset = _ENTRY_HEADER.size + _BUFFER_SPAN.size * len(buffers) + len(payload)
+    spans, chunks = [], [payload]
+    for view in buffers:
+        padding = -offset % BUFFER_ALIGNMENT
+        chunks += [b"\0" * padding, view]
+        offset += padding
+        spans.append(_BUFFER_SPAN.pack(offset, view.nbytes))
+        offset += view.nbytes
+    return [_ENTRY_HEADER.pack(_ENTRY_MAGIC, len(payload), len(buffers))] + spans + chunks
+
+
+def _load_entry(data: memoryview) -> Tuple[float, Any]:
+    """(cost, value) from an entry written by _dump_entry, or a plain pickle."""
+    if data[:len(_ENTRY_MAGIC)] != _ENTRY_MAGIC:
+        return pickle.loads(data)
+    if len(data) < _ENTRY_HEADER.size:
+        raise pickle.UnpicklingError("truncated cache entry")
+    _, length, count = _ENTRY_HEADER.unpack_from(data)
+    start = _ENTRY_HEADER.size + _BUFFER_SPAN.size * count
+    if start + length > len(data):
+        raise pickle.UnpicklingError("truncated cache entry")
+    buffers = []
+    for i in range(count):
+        offset, size = _BUFFER_SPAN.unpack_from(data, _ENTRY_HEADER.size + _BUFFER_SPAN.size * i)
+        if offset + size > len(data):
+            raise pickle.UnpicklingError("truncated cache entry")
+        buffers.append(data[offset:offset + size])
+    return pickle.loads(data[start:start + length], buffers=buffers)
+
+
+class DiskCache:
+    """
+    Persistent result cache shared by every process using the same directory.
+
+    Results are pickled into one file per call signature, named after the
+    signature's hex digest under <directory>/<hash algorithm>/<first two hex
+    digits>/, so fingerprints from different hash algorithms never mix.
+    Files are written to a temporary name and moved into place with
+    os.replace, so readers only ever see complete entries.
+
+    Results are pickled with protocol 5, and out-of-band buffers (NumPy
+    arrays, pickle.PickleBuffer) are stored after the pickle, aligned, as
+    raw bytes. Entries of `mmap_threshold` bytes or more are read through a
+    memory map: those buffers come back as read-only views into the map, so
+    a hit copies nothing and pages are only read from disk as the value is
+    used. The map stays open as long as such a value is alive. Other parts
+    of the value (bytes, str, nested objects) are still unpickled in full on
+    every hit. A file's mtime is its
+    write time and its atime, set explicitly on every hit, its last use. A
+    daemon thread sweeps the directory every `sweep_interval` seconds,
+    removing entries written more than `ttl` seconds ago and then the least
+    recently used ones until the total fits in `max_bytes`. Each entry also
+    records the cost of its call, for the cost-saved counter.
+    """
+
+    DEFAULT_SWEEP_INTERVAL = 60.0
+    MMAP_THRESHOLD = 1 << 20
+    # temporary files left this long by a crashed writer are removed
+    STALE_TEMP_SECONDS = 3600
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        *,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        sweep_interval: float = DEFAULT_SWEEP_INTERVAL,
+        mmap_threshold: int = MMAP_THRESHOLD,
+    ):
+        self.directory = Path(directory) / HASH_ALGORITHM
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.mmap_threshold = mmap_threshold
+
+        self._lock = threading.Lock()
+        self._sweeper: Optional[threading.Thread] = None
+        self._closed = threading.Event()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.cost_saved = 0.0
+        # totals as of the last sweep
+        self._entries = 0
+        self._bytes = 0
+
+    def path(self, key: bytes) -> Path:
+        name = key.hex()
+        return self.directory / name[:2] / name[2:]
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._scan())
+
+    def get(self, key: bytes, default: Any = None) -> Any:
+        """Return the cached result for `key`, or `default`."""
+        hit, value = self.lookup(key)
+        return value if hit else default
+
+    def lookup(self, key: bytes) -> Tuple[bool, Any]:
+        """Return (True, cached result) for `key`, or (False, None) on a miss."""
+        path = self.path(key)
+        try:
+            (cost, value), st = self._read(path)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            # missing, removed by a concurrent sweep, expired or corrupt
+            self._count("misses")
+            return False, None
+        try:
+            # atime records the last use, mtime keeps the write time for ttl
+            os.utime(path, (time.time(), st.st_mtime))
+        except OSError:
+            pass
+        self._count("hits")
+        self._count("cost_saved", cost)
+        return True, value
+
+    def put(self, key: bytes, value: Any, cost: float = 1.0):
+        """
+        Store `value` for `key`, produced by a call costing `cost`; values
+        that cannot be pickled are skipped with a warning.
+        """
+        try:
+            chunks = _dump_entry(cost, value)
+        except Exception as exc:
+            logging.warning(f"GardeFou: result not cached, cannot pickle {type(value).__name__}: {exc}")
+            return
+        path = self.path(key)
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.writelines(chunks)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self._count("writes")
+        self._start_sweeper()
+
+    def age(self, key: bytes) -> Optional[float]:
+        """Seconds since the result for `key` was written, or None if it is not cached."""
+        try:
+            return time.time() - os.stat(self.path(key)).st_mtime
+        except OSError:
+            return None
+
+    def sweep(self):
+        """Remove expired and least recently used entries, and refresh the totals in stats()."""
+        now = time.time()
+        entries = []
+        for path, st in self._scan(include_temp=True):
+            if path.name.startswith(".tmp-"):
+                if now - st.st_mtime > self.STALE_TEMP_SECONDS:
+                    self._unlink(path)
+            elif self.ttl is not None and now - st.st_mtime >= self.ttl:
+                if self._unlink(path):
+                    self._count("expirations")
+            else:
+                entries.append((max(st.st_atime, st.st_mtime), st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        if self.max_bytes is not None and total > self.max_bytes:
+            entries.sort()
+            while entries and total > self.max_bytes:
+                _, size, path = entries.pop(0)
+                total -= size
+                if self._unlink(path):
+                    self._count("evictions")
+        with self._lock:
+            self._entries = len(entries)
+            self._bytes = total
+
+    def clear(self):
+        for path, _ in self._scan(include_temp=True):
+            self._unlink(path)
+        with self._lock:
+            self._entries = 0
+            self._bytes = 0
+
+    def close(self):
+        """Stop the background sweep thread."""
+        self._closed.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for this process; entry and byte totals are as of the last sweep."""
+        lookups = self.hits + self.misses
+        return {
+            "cache_entries": self._entries,
+            "cache_bytes": self._bytes,
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "cache_hit_rate": self.hits / lookups if lookups else 0.0,
+            "cache_writes": self.writes,
+            "cache_evictions": self.evictions,
+            "cache_expirations": self.expirations,
+            "cache_cost_saved": self.cost_saved,
+        }
+
+    def _read(self, path: Path) -> Tuple[Any, os.stat_result]:
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            if self.ttl is not None and time.time() - st.st_mtime >= self.ttl:
+                raise FileNotFoundError(path)
+            if st.st_size < self.mmap_threshold:
+                data = memoryview(f.read())
+            else:
+                # not closed here: buffers in the value may still point into it
+                data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return _load_entry(data), st
+
+    def _scan(self, include_temp: bool = False):
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith(".tmp-") and not include_temp:
+                    continue
+                try:
+                    yield Path(entry.path), entry.stat()
+                except OSError:
+                    continue
+
+    def _unlink(self, path: Path) -> bool:
+        try:
+            os.unlink(path)
+            return True
+        except OSError:
+            return False
+
+    def _count(self, name: str, amount: float = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def _start_sweeper(self):
+        if self._sweeper is not None or (self.max_bytes is None and self.ttl is None):
+            return
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Thread(target=self._sweep_loop, name="gardefou-cache-sweep", daemon=True)
+            self._sweeper.start()
+
+    def _sweep_loop(self):
+        while not self._closed.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except OSError as exc:
+                logging.warning(f"GardeFou: cache sweep failed: {exc}")
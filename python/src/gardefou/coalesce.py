@@ -0,0 +1,84 @@
+"""Single-flight coalescing of identical in-flight calls."""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Lets identical concurrent calls share one execution.
+
+    The first caller for a key runs the call; callers arriving with the same
+    key while it is still running wait for it and receive its result or
+    exception. Once it finishes the key is released, and the next caller
+    starts a fresh execution.
+
+    Sync callers (threads) wait on a concurrent.futures.Future; async callers
+    await a shared task. The two kinds never share with each other, and
+    async sharing is limited to callers on the same event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures: Dict[Hashable, Future] = {}
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self.shared = 0
+
+    def do(self, key: Hashable, run: Callable[[], Any]) -> Any:
+        """Run `run()` for `key`, or wait for the identical call already running."""
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                future = self._futures[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = run()
+        except BaseException as exc:
+            self._release(self._futures, key)
+            future.set_exception(exc)
+            raise
+        self._release(self._futures, key)
+        future.set_result(result)
+        return result
+
+    async def do_async(self, key: Hashable, run: Callable[[], Awaitable[Any]]) -> Any:
+        """Await `run()` for `key`, or the identical call already running."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is not None and task.get_loop() is loop and not task.done():
+                self.shared += 1
+            else:
+                task = self._tasks[key] = loop.create_task(run())
+                task.add_done_callback(lambda t: self._release(self._tasks, key, t))
+        # shield: a cancelled waiter must not cancel the call others wait on
+        return await asyncio.shield(task)
+
+    def start_async(self, key: Hashable, run: Callable[[], Awaitable[Any]]) -> bool:
+        """
+        Start `run()` for `key` in the background on the running loop, unless
+        a call for `key` is already in flight there; return whether it was
+        started. Its outcome goes to callers sharing it through do_async.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is not None and task.get_loop() is loop and not task.done():
+                return False
+            task = self._tasks[key] = loop.create_task(run())
+            task.add_done_callback(lambda t: self._release(self._tasks, key, t))
+            # nobody may await it: mark the exception as retrieved
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return True
+
+    def _release(self, calls: Dict[Hashable, Any], key: Hashable, call: Any = None):
+        with self._lock:
+            if call is None or calls.get(key) is call:
+                calls.pop(key, None)
@@ -0,0 +1,96 @@
+"""Limit on the number of guarded calls in flight at once."""
+
+import asyncio
+import threading
+from collections import deque
+from typing import Optional
+
+
+class ConcurrencyLimiter:
+    """
+    Semaphore shared by threads and coroutines, on any number of event loops.
+
+    A slot is taken with acquire() (blocking the thread) or acquire_async()
+    (awaiting without blocking the loop) and given back with release(). One
+    lock guards the count and a single FIFO queue of waiters, so threads and
+    coroutines are served in arrival order; a released slot is handed
+    directly to the next waiter rather than freed and raced for.
+    """
+
+    def __init__(self, limit: int):
+        if limit < 1:
+            raise ValueError(f"limit must be at least 1, got {limit}")
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._active = 0
+        # threading.Event for threads, (loop, future) for coroutines
+        self._waiters: deque = deque()
+        self.waited = 0
+
+    @property
+    def active(self) -> int:
+        """Slots currently taken."""
+        return self._active
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Take a slot, waiting up to `timeout` seconds; return whether one was taken."""
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                return True
+            event = threading.Event()
+            self._waiters.append(event)
+            self.waited += 1
+        if event.wait(timeout):
+            return True
+        with self._lock:
+            if event in self._waiters:
+                self._waiters.remove(event)
+                return False
+        # the slot was handed over just as the wait timed out
+        return True
+
+    async def acquire_async(self):
+        """Take a slot, awaiting one if all are in use."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+            self.waited += 1
+        future = waiter[1]
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            if future.done() and not future.cancelled():
+                # handed a slot, but cancelled before resuming: pass it on
+                self.release()
+            # otherwise _hand_over sees the cancelled future and passes it on
+            raise
+
+    def release(self):
+        """Give a slot back, handing it to the longest waiting thread or coroutine."""
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                loop, future = waiter
+                if loop.is_closed():
+                    continue
+                loop.call_soon_threadsafe(self._hand_over, future)
+                return
+            self._active -= 1
+
+    def _hand_over(self, future: asyncio.Future):
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
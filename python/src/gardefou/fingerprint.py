@@ -0,0 +1,591 @@
+"""Fixed-size fingerprints of call signatures for duplicate detection.
+
+Arguments are serialized canonically and streamed straight into the hasher:
+every value is written as a type tag followed by its length-prefixed
+content, dict keys are ordered, and objects whose repr would only show a
+memory address are described by their fields instead.
+"""
+
+import array
+import dataclasses
+import hashlib
+import io
+import mmap
+import os
+import stat
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePath
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:  # optional, faster hash
+    import xxhash
+except ImportError:  # pragma: no cover - depends on the environment
+    xxhash = None
+
+DIGEST_SIZE = 16
+
+HASH_ALGORITHM = "xxh3_128" if xxhash is not None else "blake2b"
+
+# Buffers at least this large are hashed separately with hashlib, which
+# releases the GIL; several of them in one call are hashed in parallel.
+LARGE_BUFFER_THRESHOLD = 1 << 20
+
+# Smaller buffers are copied into the batched writes; larger ones go to the
+# hasher directly, from the caller's memory
+_INLINE_BUFFER_LIMIT = 1 << 12
+
+_pack_len = struct.Struct("<Q").pack
+_pack_float = struct.Struct("<d").pack
+
+# User hooks: type -> fn(obj) returning a stand-in value to fingerprint
+_FINGERPRINTERS: Dict[type, Callable[[Any], Any]] = {}
+# Resolved writer per concrete type, rebuilt whenever a hook is registered
+_DISPATCH: Dict[type, Callable[["_Encoder", Any], None]] = {}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+# File content digests keyed by (device, inode, size, mtime), so that a
+# repeated check of an unchanged file costs a single stat
+FILE_DIGEST_CACHE_SIZE = 4096
+_file_digests: "OrderedDict[Tuple[int, int, int, int], bytes]" = OrderedDict()
+_file_digests_lock = threading.Lock()
+
+
+def new_hasher():
+    """Return a streaming hasher producing DIGEST_SIZE-byte digests."""
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+
+def register_fingerprinter(cls: type, fn: Callable[[Any], Any]):
+    """
+    Control how instances of `cls` (and its subclasses) are fingerprinted.
+
+    `fn(obj)` returns any value that identifies the call-relevant state of
+    `obj` (a str, a tuple of fields, a dict...); that value is fingerprinted
+    in place of `obj`. Registered hooks take precedence over built-in rules.
+    """
+    _FINGERPRINTERS[cls] = fn
+    _DISPATCH.clear()
+
+
+def fingerprint(
+    fn_name: Optional[str],
+    args: tuple = (),
+    kwargs: Optional[Dict[str, Any]] = None,
+    *,
+    large_buffer_threshold: int = LARGE_BUFFER_THRESHOLD,
+    file_contents: bool = False,
+) -> bytes:
+    """
+    Reduce a call signature to a DIGEST_SIZE-byte digest.
+
+    Two calls get the same fingerprint when they have the same function name
+    and canonically equal positional and keyword arguments, so memory per
+    tracked call stays constant however large the arguments are.
+
+    bytes, bytearray, memoryview and other buffer-protocol arguments are
+    hashed in place without copying; those of `large_buffer_threshold` bytes
+    or more are hashed on their own with hashlib (see LARGE_BUFFER_THRESHOLD).
+
+    With `file_contents=True`, path objects and open files are fingerprinted
+    by the content of the file they point to rather than by name.
+    """
+    kwargs = kwargs or {}
+    h = new_hasher()
+    data = _flat_call_bytes(fn_name, args, kwargs)
+    if data is not None:
+        h.update(data)
+        return h.digest()
+    encoder = _Encoder(h.update, large_buffer_threshold, file_contents)
+    encoder.feed(fn_name)
+    encoder.feed(args)
+    encoder.feed(kwargs)
+    encoder.finish()
+    return h.digest()
+
+
+def _flat_call_bytes(fn_name: Any, args: Any, kwargs: Any) -> Optional[bytes]:
+    """
+    Encoding of a call whose arguments are all scalars, built without an
+    encoder; None for any other call. Same bytes as the encoder writes.
+    """
+    if type(args) is not tuple or type(kwargs) is not dict:
+        return None
+    scalars = _SCALAR_BYTES
+    try:
+        parts = [scalars[type(fn_name)](fn_name), b"t" + _pack_len(len(args))]
+        for arg in args:
+            parts.append(scalars[type(arg)](arg))
+        parts.append(b"d" + _pack_len(len(kwargs)))
+        if kwargs:
+            if not all(type(k) is str for k in kwargs):
+                return None
+            for key in sorted(kwargs):
+                value = kwargs[key]
+                parts.append(_str_bytes(key))
+                parts.append(scalars[type(value)](value))
+    except KeyError:
+        return None
+    return b"".join(parts)
+
+
+def _large_buffer_digest(view: memoryview) -> bytes:
+    # hashlib releases the GIL while hashing buffers of more than 2 KiB
+    return hashlib.blake2b(view, digest_size=DIGEST_SIZE).digest()
+
+
+def _cached_file_digest(st: os.stat_result) -> Optional[bytes]:
+    """Digest remembered for the file version described by `st`, if any."""
+    key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+    with _file_digests_lock:
+        digest = _file_digests.get(key)
+        if digest is not None:
+            _file_digests.move_to_end(key)
+        return digest
+
+
+def _file_digest(fd: int) -> Optional[bytes]:
+    """Content digest of the regular file open as `fd`, or None for other kinds."""
+    st = os.fstat(fd)
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    digest = _cached_file_digest(st)
+    if digest is not None:
+        return digest
+    key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    if st.st_size:
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped:
+            h.update(mapped)
+    digest = h.digest()
+
+    with _file_digests_lock:
+        _file_digests[key] = digest
+        if len(_file_digests) > FILE_DIGEST_CACHE_SIZE:
+            _file_digests.popitem(last=False)
+    return digest
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=min(4, os.cpu_count() or 1),
+                thread_name_prefix="gardefou-hash",
+            )
+        return _executor
+
+
+class _Encoder:
+    """
+    Writes the canonical encoding of values into a `sink` callable.
+
+    Small writes are collected and handed to the sink in one piece by
+    flush(), as each hasher update has a fixed cost that dominates the
+    encoding of typical (short) arguments.
+    """
+
+    __slots__ = (
+        "update", "large_buffer_threshold", "file_contents",
+        "_sink", "_parts", "_active", "_large_buffers",
+    )
+
+    def __init__(
+        self,
+        sink: Callable[[bytes], Any],
+        large_buffer_threshold: int = LARGE_BUFFER_THRESHOLD,
+        file_contents: bool = False,
+    ):
+        self._sink = sink
+        self._parts: List[bytes] = []
+        self.update = self._parts.append
+        self.large_buffer_threshold = large_buffer_threshold
+        self.file_contents = file_contents
+        # ids of containers being written, to cut reference cycles
+        self._active = set()
+        self._large_buffers: List[memoryview] = []
+
+    def feed(self, obj: Any):
+        cls = type(obj)
+        writer = _DISPATCH.get(cls)
+        if writer is None:
+            writer = _DISPATCH[cls] = _resolve(cls)
+        writer(self, obj)
+
+    def enter(self, obj: Any) -> bool:
+        key = id(obj)
+        if key in self._active:
+            self.update(b"R")
+            return False
+        self._active.add(key)
+        return True
+
+    def leave(self, obj: Any):
+        self._active.discard(id(obj))
+
+    def flush(self):
+        parts = self._parts
+        if parts:
+            self._sink(parts[0] if len(parts) == 1 else b"".join(parts))
+            parts.clear()
+
+    def write_buffer(self, view: memoryview):
+        """Write a contiguous buffer; large ones are deferred to finish()."""
+        size = view.nbytes
+        if size >= self.large_buffer_threshold:
+            self.update(b"B" + _pack_len(size))
+            self._large_buffers.append(view)
+        elif size >= _INLINE_BUFFER_LIMIT:
+            self.update(b"b" + _pack_len(size))
+            self.flush()
+            self._sink(view)
+        else:
+            self.update(b"b" + _pack_len(size))
+            self.update(view)
+
+    def digest(self, obj: Any) -> bytes:
+        """
+        Separate digest of `obj`, for ordering unordered items, written by a
+        child encoder with the same settings and the same cycle guard.
+        """
+        h = new_hasher()
+        child = _Encoder(h.update, self.large_buffer_threshold, self.file_contents)
+        child._active = self._active
+        child.feed(obj)
+        child.finish()
+        return h.digest()
+
+    def finish(self):
+        """Flush, then append the digests of deferred large buffers, in the order written."""
+        views = self._large_buffers
+        if views:
+            if len(views) == 1:
+                digests = [_large_buffer_digest(views[0])]
+            else:
+                digests = _get_executor().map(_large_buffer_digest, views)
+            for digest in digests:
+                self.update(digest)
+            views.clear()
+        self.flush()
+
+
+# -- writers ---------------------------------------------------------------
+
+def _none_bytes(obj: None) -> bytes:
+    return b"N"
+
+
+def _bool_bytes(obj: bool) -> bytes:
+    return b"T" if obj else b"F"
+
+
+def _int_bytes(obj: int) -> bytes:
+    data = int(obj).to_bytes(obj.bit_length() // 8 + 1, "little", signed=True)
+    return b"i" + _pack_len(len(data)) + data
+
+
+def _float_bytes(obj: float) -> bytes:
+    return b"f" + _pack_float(obj)
+
+
+def _str_bytes(obj: str) -> bytes:
+    data = obj.encode("utf-8", "surrogatepass")
+    return b"s" + _pack_len(len(data)) + data
+
+
+# Encodings of the exact scalar types, inlined by the container writers
+_SCALAR_BYTES: Dict[type, Callable[[Any], bytes]] = {
+    type(None): _none_bytes,
+    bool: _bool_bytes,
+    int: _int_bytes,
+    float: _float_bytes,
+    str: _str_bytes,
+}
+
+
+def _write_none(enc: _Encoder, obj: None):
+    enc.update(b"N")
+
+
+def _write_bool(enc: _Encoder, obj: bool):
+    enc.update(b"T" if obj else b"F")
+
+
+def _write_int(enc: _Encoder, obj: int):
+    enc.update(_int_bytes(obj))
+
+
+def _write_float(enc: _Encoder, obj: float):
+    enc.update(b"f" + _pack_float(obj))
+
+
+def _write_str(enc: _Encoder, obj: str):
+    enc.update(_str_bytes(obj))
+
+
+def _write_buffer(enc: _Encoder, obj):
+    """bytes-like objects: hashed by content through a zero-copy memoryview."""
+    view = obj if type(obj) is memoryview else memoryview(obj)
+    if not view.c_contiguous:
+        view = memoryview(view.tobytes())
+    enc.write_buffer(view)
+
+
+def _write_sequence(tag: bytes):
+    def write(enc: _Encoder, obj):
+        if not enc.enter(obj):
+            return
+        update = enc.update
+        update(tag + _pack_len(len(obj)))
+        if obj and type(obj[0]) is dict:
+            data = _messages_bytes(obj)
+            if data is not None:
+                update(data)
+                enc.leave(obj)
+                return
+        for item in obj:
+            cls = type(item)
+            scalar = _SCALAR_BYTES.get(cls)
+            if scalar is not None:
+                update(scalar(item))
+            elif cls is dict:
+                _write_dict(enc, item)
+            else:
+                enc.feed(item)
+        enc.leave(obj)
+    return write
+
+
+_MESSAGE_HEAD = b"d" + _pack_len(2) + b"s" + _pack_len(7) + b"content" + b"s"
+_ROLE_HEAD = b"s" + _pack_len(4) + b"role" + b"s"
+
+
+def _write_message(enc: _Encoder, obj: dict) -> bool:
+    """
+    Fast path for {"role": str, "content": str} chat messages, written in a
+    single update. Writes the same bytes as _write_dict would and returns
+    False when `obj` is not one.
+    """
+    content = obj.get("content")
+    role = obj.get("role")
+    if type(content) is not str or type(role) is not str:
+        return False
+    content = content.encode("utf-8", "surrogatepass")
+    role = role.encode("utf-8", "surrogatepass")
+    enc.update(b"".join((
+        _MESSAGE_HEAD, _pack_len(len(content)), content,
+        _ROLE_HEAD, _pack_len(len(role)), role,
+    )))
+    return True
+
+
+def _messages_bytes(items) -> Optional[bytes]:
+    """
+    Encoding of a whole sequence of chat messages, built in one pass; None
+    as soon as an item is not a {"role": str, "content": str} message.
+    """
+    parts: List[bytes] = []
+    extend = parts.extend
+    for item in items:
+        if type(item) is not dict or len(item) != 2:
+            return None
+        content = item.get("content")
+        role = item.get("role")
+        if type(content) is not str or type(role) is not str:
+            return None
+        content = content.encode("utf-8", "surrogatepass")
+        role = role.encode("utf-8", "surrogatepass")
+        extend((_MESSAGE_HEAD, _pack_len(len(content)), content, _ROLE_HEAD, _pack_len(len(role)), role))
+    return b"".join(parts)
+
+
+def _write_dict(enc: _Encoder, obj: dict):
+    if len(obj) == 2 and _write_message(enc, obj):
+        return
+    if not enc.enter(obj):
+        return
+    update = enc.update
+    update(b"d" + _pack_len(len(obj)))
+    if all(type(k) is str for k in obj):
+        for key in sorted(obj):
+            update(_str_bytes(key))
+            value = obj[key]
+            scalar = _SCALAR_BYTES.get(type(value))
+            if scalar is not None:
+                update(scalar(value))
+            else:
+                enc.feed(value)
+    else:
+        # mixed or unorderable keys: order the pairs by their own digests
+        for pair in sorted(enc.digest(item) for item in obj.items()):
+            update(pair)
+    enc.leave(obj)
+
+
+def _write_set(enc: _Encoder, obj):
+    enc.update(b"S" + _pack_len(len(obj)))
+    for item in sorted(enc.digest(item) for item in obj):
+        enc.update(item)
+
+
+def _write_type_name(enc: _Encoder, cls: type, tag: bytes):
+    enc.update(tag)
+    _write_str(enc, f"{cls.__module__}.{cls.__qualname__}")
+
+
+def _write_registered(fn: Callable[[Any], Any]):
+    def write(enc: _Encoder, obj):
+        _write_type_name(enc, type(obj), b"U")
+        enc.feed(fn(obj))
+    return write
+
+
+def _write_dataclass(enc: _Encoder, obj):
+    if not enc.enter(obj):
+        return
+    _write_type_name(enc, type(obj), b"D")
+    for field in dataclasses.fields(obj):
+        if field.compare:
+            _write_str(enc, field.name)
+            enc.feed(getattr(obj, field.name))
+    enc.leave(obj)
+
+
+def _write_model(dump: str):
+    def write(enc: _Encoder, obj):
+        _write_type_name(enc, type(obj), b"P")
+        enc.feed(getattr(obj, dump)())
+    return write
+
+
+def _write_ndarray(enc: _Encoder, obj):
+    enc.update(b"A")
+    _write_str(enc, obj.dtype.str)
+    enc.feed(tuple(obj.shape))
+    if obj.dtype.hasobject:
+        enc.feed(obj.tolist())
+        return
+    try:
+        # contiguous arrays are hashed in place, without a copy
+        view = memoryview(obj) if obj.flags.c_contiguous else memoryview(obj.tobytes())
+    except (TypeError, ValueError, BufferError):
+        view = memoryview(obj.tobytes())
+    enc.write_buffer(view)
+
+
+def _write_path(enc: _Encoder, obj: PurePath):
+    if enc.file_contents:
+        try:
+            st = os.stat(obj)
+        except (OSError, TypeError):
+            st = None  # missing file or pure path: fall back to the name
+        if st is not None and stat.S_ISREG(st.st_mode):
+            # a file seen before costs this one stat; it is opened only on a miss
+            digest = _cached_file_digest(st) or _path_digest(obj)
+            if digest is not None:
+                enc.update(b"C" + digest)
+                return
+    _write_object(enc, obj)
+
+
+def _path_digest(path: PurePath) -> Optional[bytes]:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        return _file_digest(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_file(enc: _Encoder, obj: io.IOBase):
+    if isinstance(obj, io.BytesIO):
+        # in-memory content is all there is to compare
+        with obj.getbuffer() as view:
+            enc.update(b"C" + _large_buffer_digest(view))
+        return
+    if enc.file_contents:
+        try:
+            digest = _file_digest(obj.fileno())
+        except (OSError, ValueError, io.UnsupportedOperation):
+            digest = None
+        if digest is not None:
+            enc.update(b"C" + digest)
+            return
+    _write_object(enc, obj)
+
+
+def _write_object(enc: _Encoder, obj):
+    cls = type(obj)
+    if cls.__repr__ is not object.__repr__:
+        _write_type_name(enc, cls, b"r")
+        _write_str(enc, repr(obj))
+        return
+    # the default repr only shows a memory address: describe the state instead
+    if not enc.enter(obj):
+        return
+    _write_type_name(enc, cls, b"o")
+    state = getattr(obj, "__dict__", None)
+    if state is None:
+        slots = [name for klass in cls.__mro__ for name in getattr(klass, "__slots__", ())]
+        state = {name: getattr(obj, name) for name in slots if hasattr(obj, name)}
+    if state:
+        enc.feed(state)
+    else:
+        # no state Python can see (e.g. a database connection): only identity tells them apart
+        enc.update(b"i")
+        _write_int(enc, id(obj))
+    enc.leave(obj)
+
+
+_BUILTIN_WRITERS = {
+    type(None): _write_none,
+    bool: _write_bool,
+    int: _write_int,
+    float: _write_float,
+    str: _write_str,
+    bytes: _write_buffer,
+    bytearray: _write_buffer,
+    memoryview: _write_buffer,
+    array.array: _write_buffer,
+    mmap.mmap: _write_buffer,
+    list: _write_sequence(b"l"),
+    tuple: _write_sequence(b"t"),
+    dict: _write_dict,
+    set: _write_set,
+    frozenset: _write_set,
+}
+
+
+def _resolve(cls: type) -> Callable[[_Encoder, Any], None]:
+    """Pick the writer for `cls`: user hooks, builtins, known shapes, fallback."""
+    for klass in cls.__mro__:
+        if klass in _FINGERPRINTERS:
+            return _write_registered(_FINGERPRINTERS[klass])
+    for klass in cls.__mro__:
+        if klass in _BUILTIN_WRITERS:
+            return _BUILTIN_WRITERS[klass]
+    if dataclasses.is_dataclass(cls):
+        return _write_dataclass
+    if callable(getattr(cls, "model_dump", None)):  # pydantic v2
+        return _write_model("model_dump")
+    if hasattr(cls, "__fields__") and callable(getattr(cls, "dict", None)):  # pydantic v1
+        return _write_model("dict")
+    if cls.__module__ == "numpy" and hasattr(cls, "dtype") and hasattr(cls, "flags"):
+        return _write_ndarray
+    if hasattr(cls, "__buffer__"):  # buffer protocol in Python code (3.12+)
+        return _write_buffer
+    if issubclass(cls, PurePath):
+        return _write_path
+    if issubclass(cls, io.IOBase):
+        return _write_file
+    return _write_object
@@ -19,13 +19,26 @@ USAGE:
     now it should be:
         result = guard(llm.generate, prompt)
 
+    # 5) To make identical concurrent calls share one underlying call:
+    guard = GardeFou(on_violation_duplicate_call="coalesce")
+
+    # 6) To answer repeated calls from a cache instead of calling again:
+    guard = GardeFou(on_violation_duplicate_call="cache", config={"cache_ttl": 3600})
+
 Only calls wrapped by guard(...) are checked against the profile you set in place.
 """
 
 
+import asyncio
+import functools
 import inspect
+import logging
+import types
 from .profile import Profile
 
+# How a guarded function runs, see _kind()
+_SYNC, _ASYNC, _STREAM, _ASYNC_STREAM = "sync", "async", "stream", "async stream"
+
 class GardeFou:
     """
     Callable guard that wraps explicit paid-API calls.
@@ -42,17 +55,349 @@ class GardeFou:
             # Delegate all config to Profile
             self._profile = Profile(**profile_kwargs)
 
+    @property
+    def profile(self) -> Profile:
+        """The Profile whose rules this guard enforces (e.g. for profile.stats())."""
+        return self._profile
+
     def __call__(self, fn, *args, **kwargs):
         """
         Enforce configured rules, then dispatch to the real function.
         
         This will run any enabled checks (max_calls, duplicate detection)
         via Profile.check(), then call the provided function (sync or async).
+
+        With on_violation_duplicate_call="coalesce", a call identical to one
+        still in flight is not made: it waits for the running one and gets
+        its result or exception (threads block, coroutines await).
+
+        With on_violation_duplicate_call="cache", a call whose result is
+        cached returns it without calling `fn` or counting against the
+        quota; for coroutine functions an awaitable resolving to it is
+        returned. Misses are coalesced as above, and only successful
+        results are cached. With a semantic cache configured, calls whose
+        text embeds close enough to a cached call's get its result too. For
+        coroutine functions a result older than cache_stale_after is still
+        returned at once, and a single background call (checked against the
+        quota like any other) refreshes it.
+
+        With max_cost set, each call's estimated cost is reserved by the
+        check and, once the call returns, replaced by the cost of its result
+        (e.g. from the response's token usage).
+
+        A call that fails with an exception listed in the profile's
+        refund_on setting is refunded: it no longer counts against
+        max_calls or max_cost, and retrying it is not a duplicate.
+
+        With max_concurrent set, a call beyond that many in flight waits for
+        one to finish; the slot is held until the call returns, the
+        coroutine completes or the stream is exhausted or closed.
+
+        With on_violation_rate_limit="wait", a call over the rate limit is
+        delayed until its slot: sync calls sleep, coroutine calls get an
+        awaitable that awaits asyncio.sleep first.
+
+        Generator and async generator functions (streaming responses) are
+        checked when called, like any other call, and never coalesced. In
+        "cache" mode their chunks are recorded as they are consumed; once a
+        stream has been read to the end without error, an identical call
+        replays it chunk by chunk (unless the cache_streams setting is off).
         """
-        # Run the profile’s checks, providing context for duplicate detection
-        self._profile.check(fn.__name__, args, kwargs)
+        kind = _kind(fn)
+        is_stream = kind is _STREAM or kind is _ASYNC_STREAM
+        if self._profile.on_violation_duplicate_call == "coalesce" and not is_stream:
+            return self._coalesced(fn, kind, args, kwargs)
+        if self._profile.on_violation_duplicate_call == "cache":
+            if not is_stream:
+                return self._cached(fn, kind, args, kwargs)
+            if self._profile.cache_streams:
+                return self._cached_stream(fn, kind, args, kwargs)
+
+        # A refunded call's signature is forgotten, so compute it up front
+        signature = None
+        if self._profile.refund_on:
+            signature = self._profile.signature(fn.__name__, args, kwargs, fn=fn)
+        cost = self._estimate(fn, args, kwargs)
+
+        # Run the profile’s checks, providing context for duplicate detection;
+        # async callers wait out a rate-limit delay without blocking the loop
+        delay = self._profile.check(
+            fn.__name__, args, kwargs, fn=fn, signature=signature,
+            block=kind is _SYNC or kind is _STREAM, cost=cost,
+        )
 
         # Delegate to the real call
-        if inspect.iscoroutinefunction(fn):
-            return fn(*args, **kwargs)
-        return fn(*args, **kwargs)
\ No newline at end of file
+        return self._invoke(fn, kind, args, kwargs, delay, signature, cost)
+
+    def _invoke(self, fn, kind, args, kwargs, delay=0.0, signature=None, cost=None):
+        """
+        Make the real call to `fn`, of the given _kind(), after any
+        rate-limit `delay` (async functions only) and holding a
+        max_concurrent slot until it completes, and
+        report its outcome to the profile: a call that returns commits its
+        actual cost in place of the estimated `cost` reserved by check(),
+        one that fails with an error listed in refund_on is refunded.
+        Coroutine functions get a wrapper coroutine, so completion, errors
+        and cancellation are seen too.
+        """
+        profile = self._profile
+        limiter = profile.concurrency
+        if kind is _ASYNC:
+            return _run_async(profile, fn, args, kwargs, delay, limiter, signature, cost)
+        if kind is _ASYNC_STREAM:
+            return _run_async_stream(profile, fn, args, kwargs, delay, limiter, signature, cost)
+        if kind is _STREAM:
+            return _run_stream(profile, fn, args, kwargs, limiter, signature, cost)
+        if limiter is not None:
+            limiter.acquire()
+        started = profile.call_started()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as exc:
+            profile.call_finished(started, exc, signature, cost)
+            raise
+        finally:
+            if limiter is not None:
+                limiter.release()
+        profile.call_finished(started)
+        if cost is not None:
+            profile.commit(cost, fn, args, kwargs, result)
+        return result
+
+    def _estimate(self, fn, args, kwargs):
+        """Estimated cost of the call to reserve against max_cost, or None without a budget."""
+        if self._profile.max_cost is None:
+            return None
+        return self._profile.call_cost(fn, args, kwargs)
+
+    def _coalesced(self, fn, kind, args, kwargs):
+        """Share one execution between identical in-flight calls."""
+        profile = self._profile
+        signature = profile.signature(fn.__name__, args, kwargs, fn=fn)
+        cost = self._estimate(fn, args, kwargs)
+
+        if kind is _ASYNC:
+            async def run_async():
+                await _acheck(profile, fn, args, kwargs, signature, cost)
+                return await self._invoke(fn, kind, args, kwargs, signature=signature, cost=cost)
+
+            return profile.single_flight.do_async(signature, run_async)
+
+        def run():
+            profile.check(fn.__name__, args, kwargs, fn=fn, signature=signature, cost=cost)
+            return self._invoke(fn, kind, args, kwargs, signature=signature, cost=cost)
+
+        return profile.single_flight.do(signature, run)
+
+    def _cached(self, fn, kind, args, kwargs):
+        """Answer the call from the result cache, or make it and cache the result."""
+        profile = self._profile
+        cache = profile.result_cache
+        signature = profile.signature(fn.__name__, args, kwargs, fn=fn)
+        hit, value = cache.lookup(signature)
+        query = None
+        if not hit and profile.semantic_cache is not None:
+            query = profile.semantic_query(fn.__name__, args, kwargs, fn=fn)
+            if query is not None:
+                hit, value = profile.semantic_cache.lookup(*query)
+
+        def store(result):
+            cache.put(signature, result, cost=profile.call_cost(fn, args, kwargs, result))
+            if query is not None:
+                profile.semantic_cache.put(*query, result)
+
+        cost = self._estimate(fn, args, kwargs)
+        if kind is _ASYNC:
+            async def run_async():
+                await _acheck(profile, fn, args, kwargs, signature, cost)
+                result = await self._invoke(fn, kind, args, kwargs, signature=signature, cost=cost)
+                store(result)
+                return result
+
+            if not hit:
+                return profile.single_flight.do_async(signature, run_async)
+            if not self._is_stale(signature):
+                return _resolved(value)
+
+            async def refresh():
+                try:
+                    return await run_async()
+                except Exception as exc:
+                    logging.warning(f"GardeFou: background refresh of {fn.__name__} failed: {exc}")
+                    raise
+
+            return _resolved(value, lambda: profile.single_flight.start_async(signature, refresh))
+
+        if hit:
+            return value
+
+        def run():
+            profile.check(fn.__name__, args, kwargs, fn=fn, signature=signature, cost=cost)
+            result = self._invoke(fn, kind, args, kwargs, signature=signature, cost=cost)
+            store(result)
+            return result
+
+        return profile.single_flight.do(signature, run)
+
+    def _cached_stream(self, fn, kind, args, kwargs):
+        """Replay a cached stream, or make the call and record its chunks."""
+        profile = self._profile
+        cache = profile.result_cache
+        signature = profile.signature(fn.__name__, args, kwargs, fn=fn)
+        hit, chunks = cache.lookup(signature)
+        is_async = kind is _ASYNC_STREAM
+        if hit:
+            return _areplay(chunks) if is_async else _replay(chunks)
+
+        def store(chunks):
+            cache.put(signature, chunks, cost=profile.call_cost(fn, args, kwargs, chunks))
+
+        cost = self._estimate(fn, args, kwargs)
+        delay = profile.check(
+            fn.__name__, args, kwargs, fn=fn, signature=signature, block=not is_async, cost=cost
+        )
+        stream = self._invoke(fn, kind, args, kwargs, delay, signature, cost)
+        return _arecord(stream, store) if is_async else _record(stream, store)
+
+    def _is_stale(self, signature):
+        """Whether a cached result is past cache_stale_after and due for a refresh."""
+        stale_after = self._profile.cache_stale_after
+        age = getattr(self._profile.result_cache, "age", None)
+        if stale_after is None or age is None:
+            return False
+        seconds = age(signature)
+        return seconds is not None and seconds >= stale_after
+
+
+def _kind(fn):
+    """
+    How `fn` runs: _SYNC, _ASYNC (coroutine function), _STREAM or
+    _ASYNC_STREAM (generator functions). Bound methods and partials are
+    unwrapped as inspect does, and the code flags read once.
+    """
+    target = fn
+    while True:
+        if isinstance(target, types.MethodType):
+            target = target.__func__
+        elif isinstance(target, functools.partial):
+            target = target.func
+        else:
+            break
+    if isinstance(target, types.FunctionType):
+        flags = target.__code__.co_flags
+        if flags & inspect.CO_COROUTINE:
+            return _ASYNC
+        if flags & inspect.CO_ASYNC_GENERATOR:
+            return _ASYNC_STREAM
+        if flags & inspect.CO_GENERATOR:
+            return _STREAM
+        if not target.__dict__:
+            return _SYNC
+    # other callables, or functions that may carry a marker such as
+    # inspect.markcoroutinefunction's instead of a flag
+    return _ASYNC if inspect.iscoroutinefunction(fn) else _SYNC
+
+
+async def _acheck(profile, fn, args, kwargs, signature, cost=None):
+    """Profile.check from a coroutine, sleeping out any rate-limit delay."""
+    delay = profile.check(fn.__name__, args, kwargs, fn=fn, signature=signature, block=False, cost=cost)
+    if delay:
+        await asyncio.sleep(delay)
+
+
+async def _run_async(profile, fn, args, kwargs, delay, limiter, signature, cost):
+    if delay:
+        await asyncio.sleep(delay)
+    if limiter is not None:
+        await limiter.acquire_async()
+    try:
+        started = profile.call_started()
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as exc:
+            profile.call_finished(started, exc, signature, cost)
+            raise
+        profile.call_finished(started)
+        if cost is not None:
+            profile.commit(cost, fn, args, kwargs, result)
+        return result
+    finally:
+        if limiter is not None:
+            limiter.release()
+
+
+async def _run_async_stream(profile, fn, args, kwargs, delay, limiter, signature, cost):
+    if delay:
+        await asyncio.sleep(delay)
+    if limiter is not None:
+        await limiter.acquire_async()
+    try:
+        started = profile.call_started()
+        stream = fn(*args, **kwargs)
+        try:
+            async for chunk in stream:
+                yield chunk
+        except BaseException as exc:
+            profile.call_finished(started, exc, signature, cost)
+            raise
+        finally:
+            await stream.aclose()
+        profile.call_finished(started)
+    finally:
+        if limiter is not None:
+            limiter.release()
+
+
+def _run_stream(profile, fn, args, kwargs, limiter, signature, cost):
+    if limiter is not None:
+        limiter.acquire()
+    try:
+        started = profile.call_started()
+        try:
+            yield from fn(*args, **kwargs)
+        except BaseException as exc:
+            profile.call_finished(started, exc, signature, cost)
+            raise
+        profile.call_finished(started)
+    finally:
+        if limiter is not None:
+            limiter.release()
+
+
+def _record(stream, store):
+    """Yield the chunks of `stream`, passing them all to `store` if it completes."""
+    chunks = []
+    try:
+        for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+    finally:
+        stream.close()
+    store(tuple(chunks))
+
+
+async def _arecord(stream, store):
+    """Async version of _record."""
+    chunks = []
+    try:
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+    finally:
+        await stream.aclose()
+    store(tuple(chunks))
+
+
+def _replay(chunks):
+    yield from chunks
+
+
+async def _areplay(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def _resolved(value, on_await=None):
+    if on_await is not None:
+        on_await()
+    return value
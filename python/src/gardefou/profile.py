@@ -1,13 +1,92 @@
+import asyncio
+import builtins
+import importlib
 import json
 import logging
+import reprlib
+import threading
+import time
 from pathlib import Path
-from typing import Any, Dict, Optional, Union, Set
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Type, Union
 
 import yaml  # ensure pyyaml is listed as a dependency
 
+from .cache import DiskCache, ResultCache
+from .coalesce import SingleFlight
+from .concurrency import ConcurrencyLimiter
+from .fingerprint import fingerprint
+from .ratelimit import RateLimiter
+from .semantic import SemanticCache
+from .similarity import MinHashLSH, extract_text
+from .storage import BloomSignatureStore, ShardedSignatureStore, SignatureStore, WindowedSignatureStore
+
+DEFAULT_SHARDS = 16
+
 class QuotaExceededError(Exception):
     """Raised when the call quota is exceeded."""
 
+def _qualified_name(fn: Optional[Callable], fn_name: Optional[str]) -> Optional[str]:
+    """Module-qualified name of `fn`, so e.g. two different `create` methods differ."""
+    qualname = getattr(fn, "__qualname__", None)
+    if qualname is None:
+        return fn_name
+    return f"{getattr(fn, '__module__', None)}.{qualname}"
+
+def _price(table: Dict[Callable, float], fn: Optional[Callable]) -> Optional[float]:
+    """Entry for `fn` in a per-function price table; bound methods match their function."""
+    price = table.get(fn)
+    if price is None:
+        price = table.get(getattr(fn, "__func__", None))
+    return price
+
+def _total_tokens(result: Any) -> Optional[int]:
+    """`usage.total_tokens` of an OpenAI-style response (object or dict), if it has one."""
+    usage = result.get("usage") if isinstance(result, dict) else getattr(result, "usage", None)
+    if isinstance(usage, dict):
+        return usage.get("total_tokens")
+    return getattr(usage, "total_tokens", None)
+
+class _ArgRepr(reprlib.Repr):
+    """Bounded repr for violation messages: large payloads are summarized, not printed."""
+
+    def __init__(self):
+        super().__init__()
+        self.maxstring = self.maxother = 200
+
+    def repr_bytes(self, obj, level):
+        if len(obj) > self.maxstring:
+            return f"<{type(obj).__name__} of {len(obj)} bytes>"
+        return repr(obj)
+
+    repr_bytearray = repr_bytes
+
+    def repr_memoryview(self, obj, level):
+        return f"<memoryview of {obj.nbytes} bytes>"
+
+_arg_repr = _ArgRepr().repr
+
+def _exception_types(value: Any) -> Tuple[Type[BaseException], ...]:
+    """
+    Exception classes from `refund_on`: classes or their names, either
+    builtin ("TimeoutError") or dotted ("openai.APITimeoutError").
+    """
+    if value is None:
+        return ()
+    if isinstance(value, (str, type)):
+        value = [value]
+    types = []
+    for item in value:
+        if isinstance(item, str):
+            module, _, name = item.rpartition(".")
+            try:
+                item = getattr(importlib.import_module(module) if module else builtins, name)
+            except (ImportError, AttributeError):
+                raise ValueError(f"refund_on: cannot find exception class {item!r}") from None
+        if not (isinstance(item, type) and issubclass(item, BaseException)):
+            raise ValueError(f"refund_on entries must be exception classes, got {item!r}")
+        types.append(item)
+    return tuple(types)
+
 class Profile:
     """
     Holds all quota and rule settings.
@@ -19,7 +98,92 @@ class Profile:
 
     Scenario-specific callbacks override the generic on_violation setting:
       - on_violation_max_calls
+      - on_violation_max_cost
       - on_violation_duplicate_call
+      - on_violation_rate_limit
+
+    `max_concurrent` caps how many guarded calls may be in flight at once;
+    further calls wait (threads block, coroutines await) for a slot.
+
+    `rate_limit` caps the call rate, e.g. "10/s", "10/min", "10/h" or
+    "10/day"; up to N calls may burst at once, then calls are spread evenly.
+    A list such as ["20/s", "2000/h", "20000/day"] enforces every window;
+    a call rejected by one window uses up none of the others.
+    on_violation_rate_limit also accepts "wait": the call is given the next
+    free slot and waits for it instead of failing. If that would take more
+    than `rate_limit_max_wait` seconds the generic on_violation handler
+    fires instead.
+
+    on_violation_duplicate_call also accepts "coalesce": identical calls
+    made while one is still running share its result (see GardeFou).
+    With "cache", results are kept and repeated calls are answered from the
+    cache without calling the function again; the cache is bounded with the
+    config keys `cache_max_entries`, `cache_max_bytes` and `cache_ttl`
+    (seconds), and holds at most ResultCache.DEFAULT_MAX_BYTES (256 MiB,
+    estimated) when neither size limit is set. With `cache_dir` results are kept on disk instead, shared
+    between processes and runs, and `cache_backend` accepts any object with
+    lookup(key) and put(key, value, cost=...) methods. `cache_policy`
+    chooses what the in-memory cache evicts first: "lru" (default) or "gds",
+    the results saving the least cost per byte (see ResultCache), and
+    `cache_admission="tinylfu"` keeps one-off results from evicting ones
+    that are reused. For coroutine functions, `cache_stale_after` (seconds,
+    below `cache_ttl`) serves older results at once while one background
+    call refreshes them. Setting `semantic_embedding` (a callable returning
+    a vector for a text; needs numpy) also answers calls whose string
+    arguments embed within cosine `semantic_threshold` (default 0.95) of a
+    cached call's, keeping up to `semantic_max_entries` (default 10,000)
+    for at most `cache_ttl` seconds. Streams from
+    generator functions are recorded and replayed unless `cache_streams` is
+    false.
+
+    `cost` prices calls, for the `max_cost` budget, cost-aware caching and
+    the cost-saved counter: a number charged for every call, a dict of
+    prices keyed by the wrapped function (unlisted functions cost nothing),
+    or a callable `cost(fn, args, kwargs, result)`, which is also called
+    with result=None before the call for an estimate. Without it every call
+    costs 1. With `cost_per_token` (a number or a per-function dict), a
+    result reporting `usage.total_tokens`, as OpenAI-style responses do, is
+    priced by its tokens instead; without `cost`, calls are then estimated
+    at `estimated_tokens` tokens (default 0) before they are made.
+
+    `max_cost` caps the total cost of calls. check() reserves each call's
+    estimated cost against it, in O(1), and once the call returns the
+    reservation is replaced by the cost of its result (see commit); streams
+    keep their estimate.
+
+    Duplicate detection keeps every signature it has seen unless bounded with
+    the config keys `duplicate_max_entries`, `duplicate_max_bytes` and
+    `duplicate_ttl` (seconds); the least recently seen signatures go first.
+    With `duplicate_window_seconds` only repeats within that many seconds
+    count, tracked in `duplicate_window_buckets` time slots (default 10).
+    With duplicate_detection="probabilistic" signatures go into a scalable
+    Bloom filter instead, sized by `duplicate_error_rate` and capped at
+    `duplicate_max_bytes`. Either store is split into locked shards
+    (`duplicate_shards`) so that concurrent calls rarely wait on each other.
+
+    Setting `near_duplicate_threshold` (a Jaccard similarity, e.g. 0.9) also
+    flags calls whose string arguments are nearly identical to an earlier
+    call's, through the same on_violation_duplicate_call handler; texts are
+    forgotten after `duplicate_window_seconds` or `duplicate_ttl` if set.
+
+    With `fingerprint_file_contents` set, pathlib paths and open files are
+    compared by the content of the file rather than by name.
+
+    check() reserves a call against max_calls before it is made, so calls
+    in flight count too. `refund_on` lists exception classes (or their
+    names, e.g. "TimeoutError" or "openai.APITimeoutError") for which a
+    failed call is refunded: it no longer counts against max_calls, and its
+    signature and near-duplicate text are forgotten so that a retry is not
+    taken for a duplicate (except with duplicate_detection="probabilistic",
+    which cannot forget).
+
+    Duplicate detection compares all arguments unless narrowed with:
+      - dedup_key:    callable taking the call's arguments and returning the
+                      value to compare, e.g. `lambda prompt, **kw: prompt`
+      - dedup_ignore: keyword names (str) or positional indexes (int) to leave
+                      out, e.g. ["request_id", "stream"]
+    Either may also be a dict keyed by the wrapped function to override the
+    rule for that function only (see also set_dedup).
     """
 
     def __init__(
@@ -27,9 +191,20 @@ class Profile:
         *,
         config: Optional[Union[str, Path, Dict[str, Any]]] = None,
         max_calls: Optional[int] = None,
+        max_cost: Optional[float] = None,
+        max_concurrent: Optional[int] = None,
         on_violation: Optional[Union[str, callable]] = None,
         on_violation_max_calls: Optional[Union[str, callable]] = None,
+        on_violation_max_cost: Optional[Union[str, callable]] = None,
         on_violation_duplicate_call: Optional[Union[str, callable]] = None,
+        rate_limit: Optional[Union[str, Iterable[str]]] = None,
+        on_violation_rate_limit: Optional[Union[str, callable]] = None,
+        duplicate_detection: Optional[str] = None,
+        duplicate_window_seconds: Optional[float] = None,
+        dedup_key: Optional[Union[Callable, Dict[Callable, Callable]]] = None,
+        dedup_ignore: Optional[Union[Iterable[Union[str, int]], Dict[Callable, Iterable[Union[str, int]]]]] = None,
+        cost: Optional[Union[float, Callable, Dict[Callable, float]]] = None,
+        refund_on: Optional[Iterable[Union[Type[BaseException], str]]] = None,
     ):
         # 1) Load base data from file if config is a path
         data: Dict[str, Any] = {}
@@ -47,81 +222,566 @@ class Profile:
         # 3) Override with explicit kwargs
         if max_calls is not None:
             data["max_calls"] = max_calls
+        if max_cost is not None:
+            data["max_cost"] = max_cost
+        if max_concurrent is not None:
+            data["max_concurrent"] = max_concurrent
         if on_violation is not None:
             data["on_violation"] = on_violation
         if on_violation_max_calls is not None:
             data["on_violation_max_calls"] = on_violation_max_calls
+        if on_violation_max_cost is not None:
+            data["on_violation_max_cost"] = on_violation_max_cost
         if on_violation_duplicate_call is not None:
             data["on_violation_duplicate_call"] = on_violation_duplicate_call
+        if rate_limit is not None:
+            data["rate_limit"] = rate_limit
+        if on_violation_rate_limit is not None:
+            data["on_violation_rate_limit"] = on_violation_rate_limit
+        if duplicate_detection is not None:
+            data["duplicate_detection"] = duplicate_detection
+        if duplicate_window_seconds is not None:
+            data["duplicate_window_seconds"] = duplicate_window_seconds
+        if dedup_key is not None:
+            data["dedup_key"] = dedup_key
+        if dedup_ignore is not None:
+            data["dedup_ignore"] = dedup_ignore
+        if cost is not None:
+            data["cost"] = cost
+        if refund_on is not None:
+            data["refund_on"] = refund_on
 
         # 4) Assign settings with defaults
         # default max_calls to -1 (no limit) when not set; allow explicit 0
         self.max_calls = data.get("max_calls", -1)
         self.on_violation = data.get("on_violation", "raise")
         self.on_violation_max_calls = data.get("on_violation_max_calls", self.on_violation)
+        self.on_violation_max_cost = data.get("on_violation_max_cost", self.on_violation)
         self.on_violation_duplicate_call = data.get("on_violation_duplicate_call", self.on_violation)
+        self.on_violation_rate_limit = data.get("on_violation_rate_limit", self.on_violation)
 
         self.call_count = 0
-        self._call_signatures: Set[Any] = set()
+        self.max_cost = data.get("max_cost")
+        # Reserved and committed cost of calls, against max_cost
+        self.cost_spent = 0.0
+        self.duplicate_count = 0
+        self.rate_limited_count = 0
+        self.refunded_count = 0
+        # Failed calls whose reservation is given back (see refund)
+        self.refund_on = _exception_types(data.get("refund_on"))
+        # Outcomes of calls made through GardeFou (see call_started / call_finished)
+        self.completed_count = 0
+        self.failed_count = 0
+        self.cancelled_count = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.rate_limit = data.get("rate_limit")
+        self._rate_limiter = RateLimiter(self.rate_limit) if self.rate_limit is not None else None
+        self.rate_limit_max_wait = data.get("rate_limit_max_wait")
+        # Slots for guarded calls in flight, taken and released by GardeFou
+        self.max_concurrent = data.get("max_concurrent")
+        self.concurrency = ConcurrencyLimiter(self.max_concurrent) if self.max_concurrent is not None else None
+        self._counter_lock = threading.Lock()
+        # Shares identical in-flight calls when on_violation_duplicate_call="coalesce"
+        self.single_flight = SingleFlight()
+        # Answers repeated calls when on_violation_duplicate_call="cache"
+        self.result_cache = None
+        self.cache_stale_after = data.get("cache_stale_after")
+        self.cache_streams = bool(data.get("cache_streams", True))
+        if self.on_violation_duplicate_call == "cache":
+            self.result_cache = self._make_result_cache(data)
+        # Answers paraphrased repeats in "cache" mode when an embedding is set
+        self.semantic_cache = None
+        if self.result_cache is not None and data.get("semantic_embedding") is not None:
+            self.semantic_cache = SemanticCache(
+                data["semantic_embedding"],
+                threshold=data.get("semantic_threshold", SemanticCache.DEFAULT_THRESHOLD),
+                max_entries=data.get("semantic_max_entries", SemanticCache.DEFAULT_MAX_ENTRIES),
+                ttl=data.get("cache_ttl"),
+            )
+        self.duplicate_detection = data.get("duplicate_detection", "exact")
+        self._call_signatures = self._make_signature_store(data)
+
+        self._fingerprint_file_contents = bool(data.get("fingerprint_file_contents", False))
+
+        self._near_duplicates = None
+        if data.get("near_duplicate_threshold") is not None:
+            self._near_duplicates = MinHashLSH(
+                threshold=data["near_duplicate_threshold"],
+                max_entries=data.get("near_duplicate_max_entries"),
+                # forget texts as the exact signatures are forgotten
+                ttl=data.get("duplicate_window_seconds", data.get("duplicate_ttl")),
+            )
+
+        # Rules narrowing which arguments duplicate detection compares
+        self._dedup_default: Tuple[Optional[Callable], frozenset] = (None, frozenset())
+        self._dedup_overrides: Dict[Callable, Tuple[Optional[Callable], frozenset]] = {}
+        key, ignore = data.get("dedup_key"), data.get("dedup_ignore")
+        if isinstance(key, dict):
+            for fn, fn_key in key.items():
+                self.set_dedup(fn, key=fn_key)
+            key = None
+        if isinstance(ignore, dict):
+            for fn, fn_ignore in ignore.items():
+                self.set_dedup(fn, ignore=fn_ignore)
+            ignore = None
+        self._dedup_default = (key, frozenset(ignore or ()))
+
+        # Price of a call: a number, a per-function dict or a callable
+        self.cost = data.get("cost")
+        self.cost_per_token = data.get("cost_per_token")
+        self.estimated_tokens = data.get("estimated_tokens", 0)
 
         # Track which rules were explicitly configured
         self._max_calls_enabled = "max_calls" in data and self.max_calls >= 0
-        self._dup_enabled = "on_violation_duplicate_call" in data
+        self._dup_enabled = "on_violation_duplicate_call" in data or self._near_duplicates is not None
 
 
-    def check(self, fn_name: Optional[str] = None, args: tuple = (), kwargs: Optional[Dict[str, Any]] = None):
+    def check(
+        self,
+        fn_name: Optional[str] = None,
+        args: tuple = (),
+        kwargs: Optional[Dict[str, Any]] = None,
+        fn: Optional[Callable] = None,
+        signature: Optional[bytes] = None,
+        block: bool = True,
+        cost: Optional[float] = None,
+    ) -> float:
         """
         Enforce configured rules for the given call.
 
         This method is idempotent and will not raise any exceptions directly.
         Instead, it will invoke the configured handler functions
-        (on_violation_max_calls and/or on_violation_duplicate_call) when a rule
-        is breached.
+        (on_violation_rate_limit, on_violation_max_calls and/or
+        on_violation_duplicate_call) when a rule is breached.
 
         Args:
             fn_name: str, name of the function being called
             args: tuple, positional arguments being passed
             kwargs: dict, keyword arguments being passed
+            fn: the function itself, when known; used for per-function dedup
+                rules and to tell apart functions sharing a name
+            signature: the call's signature if already computed with signature()
+            cost: the call's estimated cost to reserve against max_cost, if
+                already computed with call_cost()
+            block: with on_violation_rate_limit="wait", sleep until the call's
+                slot here; pass False from async code and wait for the
+                returned delay without blocking the event loop
+
+        Returns:
+            seconds the caller still has to wait before making the call
+            (always 0.0 when blocking)
+        """
+        reserved_slot, reserved_call, reserved_cost = None, False, None
+        try:
+            if self._rate_limiter is not None:
+                reserved_slot = self._check_rate_limit()
+            if self._max_calls_enabled:
+                # no extra context needed
+                reserved_call = True
+                self._check_max_call()
+            if self.max_cost is not None:
+                reserved_cost = cost if cost is not None else self.call_cost(fn, args, kwargs)
+                self._check_max_cost(reserved_cost)
+            if self._dup_enabled:
+                # needs to know exactly which call to compare
+                self._check_duplicate(fn_name, args, kwargs, fn, signature)
+        except BaseException:
+            # a rejected call is never made, so it keeps no reservation
+            if reserved_slot is not None:
+                self._rate_limiter.refund()
+            with self._counter_lock:
+                if reserved_call:
+                    self.call_count -= 1
+                if reserved_cost is not None:
+                    self.cost_spent -= reserved_cost
+            raise
+        delay = reserved_slot or 0.0
+        if delay > 0 and block:
+            time.sleep(delay)
+            return 0.0
+        return delay
+
+    def signature(
+        self,
+        fn_name: Optional[str] = None,
+        args: tuple = (),
+        kwargs: Optional[Dict[str, Any]] = None,
+        fn: Optional[Callable] = None,
+    ) -> bytes:
+        """
+        Fingerprint of a call as duplicate detection sees it, after the
+        dedup_key / dedup_ignore rules are applied.
+        """
+        dedup_args, dedup_kwargs = self._dedup_view(fn, args, kwargs or {})
+        # Fixed-size digest of the call, so large arguments are never retained
+        return fingerprint(
+            _qualified_name(fn, fn_name),
+            dedup_args,
+            dedup_kwargs,
+            file_contents=self._fingerprint_file_contents,
+        )
+
+    def semantic_query(
+        self,
+        fn_name: Optional[str] = None,
+        args: tuple = (),
+        kwargs: Optional[Dict[str, Any]] = None,
+        fn: Optional[Callable] = None,
+    ) -> Optional[Tuple[str, Any]]:
+        """
+        (scope, embedding) under which the semantic cache files a call, or
+        None when the call has no text to embed.
+        """
+        text = extract_text(*self._dedup_view(fn, args, kwargs or {}))
+        if not text:
+            return None
+        return _qualified_name(fn, fn_name), self.semantic_cache.embed(text)
+
+    def set_dedup(
+        self,
+        fn: Callable,
+        *,
+        key: Optional[Callable] = None,
+        ignore: Optional[Iterable[Union[str, int]]] = None,
+    ):
         """
-        if self._max_calls_enabled:
-            # no extra context needed
-            self._check_max_call()
-        if self._dup_enabled:
-            # needs to know exactly which call to compare
-            self._check_duplicate(fn_name, args, kwargs)
+        Override dedup_key / dedup_ignore for calls to `fn`.
 
+        `fn` is matched against the function passed to the guard; for bound
+        methods the underlying function also matches, so `Client.create`
+        covers `client.create` on every instance.
+        """
+        current_key, current_ignore = self._dedup_overrides.get(fn, (None, frozenset()))
+        self._dedup_overrides[fn] = (
+            key if key is not None else current_key,
+            frozenset(ignore) if ignore is not None else current_ignore,
+        )
+
+    def call_cost(
+        self,
+        fn: Optional[Callable],
+        args: tuple = (),
+        kwargs: Optional[Dict[str, Any]] = None,
+        result: Any = None,
+    ) -> float:
+        """
+        Price of a call to `fn` according to the `cost` setting, or to
+        `cost_per_token` when `result` reports its token usage. Priced by
+        tokens alone (no `cost`), a call not yet made is estimated at
+        `estimated_tokens` tokens, and one without usage costs nothing.
+        """
+        per_token = self.cost_per_token
+        if isinstance(per_token, dict):
+            per_token = _price(per_token, fn)
+        if result is not None and per_token is not None:
+            tokens = _total_tokens(result)
+            if tokens is not None:
+                return tokens * per_token
+        cost = self.cost
+        if cost is None:
+            if self.cost_per_token is None:
+                return 1.0
+            if result is None and per_token is not None:
+                return self.estimated_tokens * per_token
+            return 0.0
+        if isinstance(cost, dict):
+            price = _price(cost, fn)
+            return price if price is not None else 0.0
+        if callable(cost):
+            return cost(fn, args, kwargs or {}, result)
+        return cost
+
+    def _dedup_view(self, fn: Optional[Callable], args: tuple, kwargs: Dict[str, Any]) -> Tuple[tuple, Dict[str, Any]]:
+        """Reduce a call's arguments to the parts duplicate detection compares."""
+        rule = self._dedup_default
+        if fn is not None and self._dedup_overrides:
+            rule = self._dedup_overrides.get(fn) or self._dedup_overrides.get(getattr(fn, "__func__", None), rule)
+        key, ignore = rule
+        if key is not None:
+            return (key(*args, **kwargs),), {}
+        if ignore:
+            args = tuple(a for i, a in enumerate(args) if i not in ignore)
+            kwargs = {k: v for k, v in kwargs.items() if k not in ignore}
+        return args, kwargs
+
+    def call_started(self) -> float:
+        """Note that a guarded call is starting; pass the result to call_finished."""
+        return time.perf_counter()
+
+    def call_finished(
+        self,
+        started: float,
+        error: Optional[BaseException] = None,
+        signature: Optional[bytes] = None,
+        cost: Optional[float] = None,
+    ):
+        """
+        Record how a guarded call started at `started` ended: normally, with
+        `error`, or cancelled (an asyncio.CancelledError, or GeneratorExit for
+        a stream closed before its end). An `error` listed in refund_on
+        refunds the call and the `cost` reserved for it, forgetting its
+        `signature` when given.
+        """
+        if error is not None and self.refund_on and isinstance(error, self.refund_on):
+            self.refund(signature, cost)
+        elapsed = time.perf_counter() - started
+        with self._counter_lock:
+            if error is None:
+                self.completed_count += 1
+            elif isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+                self.cancelled_count += 1
+            else:
+                self.failed_count += 1
+            self.latency_total += elapsed
+            if elapsed > self.latency_max:
+                self.latency_max = elapsed
+
+    def refund(self, signature: Optional[bytes] = None, cost: Optional[float] = None):
+        """
+        Give back the reservations check() made for a call that failed (one
+        call against max_calls and `cost` against max_cost), and forget its
+        `signature` for duplicate detection.
+        """
+        with self._counter_lock:
+            self.refunded_count += 1
+            if self._max_calls_enabled:
+                self.call_count -= 1
+            if cost is not None and self.max_cost is not None:
+                self.cost_spent -= cost
+        if signature is not None:
+            self._call_signatures.discard(signature)
+            if self._near_duplicates is not None:
+                self._near_duplicates.discard(signature)
+
+    def commit(
+        self,
+        reserved: float,
+        fn: Optional[Callable],
+        args: tuple = (),
+        kwargs: Optional[Dict[str, Any]] = None,
+        result: Any = None,
+    ) -> float:
+        """
+        Replace the `reserved` estimate of a call that returned `result`
+        with its actual cost (call_cost with the result, e.g. from its
+        token usage) and return that cost.
+        """
+        actual = self.call_cost(fn, args, kwargs, result)
+        if self.max_cost is not None:
+            with self._counter_lock:
+                self.cost_spent += actual - reserved
+        return actual
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return a snapshot of counters: calls seen, duplicates detected, how
+        calls ended and their latency, and the size and eviction counts of
+        the duplicate-signature store.
+        """
+        stats = {"call_count": self.call_count, "duplicate_count": self.duplicate_count}
+        stats.update(
+            completed_count=self.completed_count,
+            failed_count=self.failed_count,
+            cancelled_count=self.cancelled_count,
+            latency_total=self.latency_total,
+            latency_max=self.latency_max,
+        )
+        if self._rate_limiter is not None:
+            stats["rate_limited_count"] = self.rate_limited_count
+        if self.refund_on:
+            stats["refunded_count"] = self.refunded_count
+        if self.max_cost is not None:
+            stats["cost_spent"] = self.cost_spent
+        if self.concurrency is not None:
+            stats["in_flight"] = self.concurrency.active
+            stats["concurrency_waits"] = self.concurrency.waited
+        stats.update(self._call_signatures.stats())
+        if self._near_duplicates is not None:
+            stats.update(self._near_duplicates.stats())
+        stats["coalesced"] = self.single_flight.shared
+        if self.result_cache is not None and hasattr(self.result_cache, "stats"):
+            stats.update(self.result_cache.stats())
+        if self.semantic_cache is not None:
+            stats.update(self.semantic_cache.stats())
+        return stats
+
+    def _make_signature_store(self, data: Dict[str, Any]) -> ShardedSignatureStore:
+        """
+        Build the duplicate-signature store for the configured mode, split
+        into `duplicate_shards` locked shards (default 16, fewer when the
+        size limits are too small to share out).
+        """
+        shards = data.get("duplicate_shards", DEFAULT_SHARDS)
+        max_bytes = data.get("duplicate_max_bytes")
+        window = data.get("duplicate_window_seconds")
+        if window is not None:
+            if self.duplicate_detection != "exact":
+                raise ValueError("duplicate_window_seconds requires duplicate_detection='exact'")
+            return ShardedSignatureStore(
+                lambda: WindowedSignatureStore(window, buckets=data.get("duplicate_window_buckets", 10)),
+                shards,
+            )
+        if self.duplicate_detection == "exact":
+            max_entries = data.get("duplicate_max_entries")
+            if max_entries is not None:
+                shards = min(shards, max(1, max_entries // 64))
+            if max_bytes is not None:
+                shards = min(shards, max(1, max_bytes // 4096))
+            return ShardedSignatureStore(
+                lambda: SignatureStore(
+                    max_entries=max_entries // shards if max_entries is not None else None,
+                    max_bytes=max_bytes // shards if max_bytes is not None else None,
+                    ttl=data.get("duplicate_ttl"),
+                ),
+                shards,
+            )
+        if self.duplicate_detection == "probabilistic":
+            if max_bytes is None:
+                max_bytes = BloomSignatureStore.DEFAULT_MAX_BYTES
+            shards = min(shards, max(1, max_bytes // 65536))
+            initial_capacity = data.get("duplicate_initial_capacity", BloomSignatureStore.DEFAULT_INITIAL_CAPACITY)
+            return ShardedSignatureStore(
+                lambda: BloomSignatureStore(
+                    error_rate=data.get("duplicate_error_rate", BloomSignatureStore.DEFAULT_ERROR_RATE),
+                    max_bytes=max_bytes // shards,
+                    initial_capacity=max(1, initial_capacity // shards),
+                ),
+                shards,
+            )
+        raise ValueError(
+            f"duplicate_detection must be 'exact' or 'probabilistic', got {self.duplicate_detection!r}"
+        )
+
+    def _make_result_cache(self, data: Dict[str, Any]):
+        """Build the result cache used by on_violation_duplicate_call="cache"."""
+        if data.get("cache_backend") is not None:
+            return data["cache_backend"]
+        if data.get("cache_dir") is not None:
+            return DiskCache(
+                data["cache_dir"],
+                max_bytes=data.get("cache_max_bytes"),
+                ttl=data.get("cache_ttl"),
+                sweep_interval=data.get("cache_sweep_interval", DiskCache.DEFAULT_SWEEP_INTERVAL),
+            )
+        max_entries, max_bytes = data.get("cache_max_entries"), data.get("cache_max_bytes")
+        if max_entries is None and max_bytes is None:
+            max_bytes = ResultCache.DEFAULT_MAX_BYTES
+        return ResultCache(
+            max_entries=max_entries,
+            max_bytes=max_bytes,
+            ttl=data.get("cache_ttl"),
+            policy=data.get("cache_policy", "lru"),
+            admission=data.get("cache_admission"),
+        )
+
+    def _handle_violation(self, handler: Union[str, callable], msg: Union[str, Callable[[], str]]):
+        """
+        Dispatch a rule breach to a "warn"/"raise"/callable handler.
+        Modes such as "coalesce", "cache" and "wait" are applied elsewhere
+        and are no-ops here. `msg` may be a function building the message,
+        called only when it is logged or raised.
+        """
+        if handler == "warn":
+            logging.warning(msg if isinstance(msg, str) else msg())
+        elif handler == "raise":
+            raise QuotaExceededError(msg if isinstance(msg, str) else msg())
+        elif callable(handler):
+            handler(self)
+
+    def _check_rate_limit(self) -> Optional[float]:
+        """
+        Take a slot from the rate limiter.
+        Uses on_violation_rate_limit handler when the rate is exceeded.
+        Returns the seconds until the slot taken for the call (always 0.0
+        outside "wait" mode), or None when the call was let through without
+        one.
+        """
+        if self.on_violation_rate_limit == "wait":
+            delay = self._rate_limiter.reserve(self.rate_limit_max_wait)
+            if delay is None or delay > 0:
+                with self._counter_lock:
+                    self.rate_limited_count += 1
+            if delay is None:
+                msg = (
+                    f"GardeFou: rate limit exceeded ({self._rate_limit_text()}), "
+                    f"next slot is more than {self.rate_limit_max_wait}s away"
+                )
+                self._handle_violation("raise" if self.on_violation == "wait" else self.on_violation, msg)
+                return None
+            return delay
+        wait = self._rate_limiter.acquire()
+        if wait > 0:
+            with self._counter_lock:
+                self.rate_limited_count += 1
+            msg = f"GardeFou: rate limit exceeded ({self._rate_limit_text()}), next call allowed in {wait:.2f}s"
+            self._handle_violation(self.on_violation_rate_limit, msg)
+            return None
+        return 0.0
+
+    def _rate_limit_text(self) -> str:
+        rate = self.rate_limit
+        return rate if isinstance(rate, str) else ", ".join(rate)
 
     def _check_max_call(self):
         """
-        Increment call count and enforce the max_calls quota.
+        Reserve the call by incrementing the call count, and enforce the
+        max_calls quota; refund() gives the reservation back.
         Uses on_violation_max_calls handler when quota is breached.
         """
-        self.call_count += 1
-        if self.call_count > self.max_calls:
-            msg = f"GardeFou: call quota exceeded ({self.call_count}/{self.max_calls})"
-            handler = self.on_violation_max_calls
-            if handler == "warn":
-                logging.warning(msg)
-            elif handler == "raise":
-                raise QuotaExceededError(msg)
-            elif callable(handler):
-                handler(self)
+        with self._counter_lock:
+            self.call_count += 1
+            count = self.call_count
+        if count > self.max_calls:
+            msg = f"GardeFou: call quota exceeded ({count}/{self.max_calls})"
+            self._handle_violation(self.on_violation_max_calls, msg)
 
-    def _check_duplicate(self, fn_name: Optional[str] = None, args: tuple = (), kwargs: Optional[Dict[str, Any]] = None):
+    def _check_max_cost(self, cost: float):
+        """
+        Reserve the call's estimated cost and enforce the max_cost budget.
+        Uses on_violation_max_cost handler when the budget is exceeded.
+        """
+        with self._counter_lock:
+            self.cost_spent += cost
+            spent = self.cost_spent
+        if spent > self.max_cost:
+            msg = f"GardeFou: cost budget exceeded ({spent:.6g}/{self.max_cost:g})"
+            self._handle_violation(self.on_violation_max_cost, msg)
+
+    def _check_duplicate(
+        self,
+        fn_name: Optional[str] = None,
+        args: tuple = (),
+        kwargs: Optional[Dict[str, Any]] = None,
+        fn: Optional[Callable] = None,
+        signature: Optional[bytes] = None,
+    ):
         """
-        Detect duplicate calls (same function name and parameters).
+        Detect duplicate calls (same function name and parameters), and
+        near-duplicates when enabled.
         Uses on_violation_duplicate_call handler when a duplicate is detected.
         """
-        # Create a simple signature key
-        sig = (fn_name, repr(args), repr(sorted(kwargs.items())))
-        if sig in self._call_signatures:
-            msg = f"GardeFou: duplicate call detected for {fn_name} with args {args} and kwargs {kwargs}"
-            handler = self.on_violation_duplicate_call
-            if handler == "warn":
-                logging.warning(msg)
-            elif handler == "raise":
-                raise QuotaExceededError(msg)
-            elif callable(handler):
-                handler(self)
-        else:
-            self._call_signatures.add(sig)
\ No newline at end of file
+        kwargs = kwargs or {}
+        if signature is None:
+            signature = self.signature(fn_name, args, kwargs, fn)
+        if self._call_signatures.check_and_add(signature):
+            with self._counter_lock:
+                self.duplicate_count += 1
+            self._handle_violation(
+                self.on_violation_duplicate_call,
+                lambda: f"GardeFou: duplicate call detected for {fn_name} "
+                f"with args {_arg_repr(args)} and kwargs {_arg_repr(kwargs)}",
+            )
+        elif self._near_duplicates is not None:
+            text = extract_text(*self._dedup_view(fn, args, kwargs))
+            if not text:
+                return
+            similarity = self._near_duplicates.check_and_add(_qualified_name(fn, fn_name), text, signature)
+            if similarity is not None:
+                with self._counter_lock:
+                    self.duplicate_count += 1
+                self._handle_violation(
+                    self.on_violation_duplicate_call,
+                    lambda: f"GardeFou: near-duplicate call detected for {fn_name} "
+                    f"(similarity {similarity:.2f}) with args {_arg_repr(args)} and kwargs {_arg_repr(kwargs)}",
+                )
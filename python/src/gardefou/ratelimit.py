@@ -0,0 +1,103 @@
+"""Call rate limiting with the generic cell rate algorithm (GCRA)."""
+
+import re
+import threading
+import time
+from typing import Callable, Iterable, List, Optional, Tuple, Union
+
+_UNITS = {
+    "s": 1.0, "sec": 1.0, "second": 1.0,
+    "min": 60.0, "minute": 60.0,
+    "h": 3600.0, "hr": 3600.0, "hour": 3600.0,
+    "d": 86400.0, "day": 86400.0,
+}
+_RATE = re.compile(r"^\s*(\d+)\s*/\s*([a-z]+?)s?\s*$")
+
+
+def parse_rate(rate: str) -> Tuple[int, float]:
+    """Parse "N/unit" (unit: s, min, h or day) into (N, period in seconds)."""
+    match = _RATE.match(rate.lower())
+    if match is None or match.group(2) not in _UNITS:
+        raise ValueError(f"rate must look like '10/s', '10/min', '10/h' or '10/day', got {rate!r}")
+    count = int(match.group(1))
+    if count < 1:
+        raise ValueError(f"rate must allow at least one call, got {rate!r}")
+    return count, _UNITS[match.group(2)]
+
+
+class RateLimiter:
+    """
+    Allows N calls per period, e.g. RateLimiter("10/min"), or several such
+    windows at once, e.g. RateLimiter(["20/s", "2000/h", "20000/day"]).
+
+    Implements GCRA: the only state per window is the theoretical arrival
+    time (TAT) of the next call, pushed forward by period/N for every call
+    allowed. A call is allowed while TAT is at most one period ahead of now,
+    so up to N calls may burst at once and the rate then settles at N per
+    period. Memory and time per call are O(1) per window.
+
+    All windows are checked and updated together under one lock: a call
+    rejected by any window takes nothing from the others.
+    """
+
+    def __init__(self, rate: Union[str, Iterable[str]], *, clock: Optional[Callable[[], float]] = None):
+        self.rate = rate
+        self.windows: List[Tuple[int, float]] = [
+            parse_rate(r) for r in ([rate] if isinstance(rate, str) else rate)
+        ]
+        if not self.windows:
+            raise ValueError("rate needs at least one window")
+        self._intervals = [period / count for count, period in self.windows]
+        self._clock = clock or time.monotonic
+        self._tats = [float("-inf")] * len(self.windows)
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Take one call's worth of capacity and return 0.0, or, when the limit
+        is reached, take nothing and return the seconds until a call would
+        be allowed.
+        """
+        with self._lock:
+            tats, wait = self._next()
+            if wait > 0:
+                return wait
+            self._tats = tats
+            return 0.0
+
+    def reserve(self, max_wait: Optional[float] = None) -> Optional[float]:
+        """
+        Book the next free slot and return the seconds to wait for it (0.0
+        if a call is allowed now). When that would be more than `max_wait`
+        seconds, nothing is booked and None is returned.
+        """
+        with self._lock:
+            tats, wait = self._next()
+            if max_wait is not None and wait > max_wait:
+                return None
+            self._tats = tats
+            return wait
+
+    def refund(self):
+        """
+        Give back one call's worth of capacity taken by acquire() or
+        reserve(), for a call that was not made after all.
+        """
+        with self._lock:
+            self._tats = [tat - interval for tat, interval in zip(self._tats, self._intervals)]
+
+    def reset(self):
+        with self._lock:
+            self._tats = [float("-inf")] * len(self.windows)
+
+    def _next(self) -> Tuple[List[float], float]:
+        """
+        Earliest time every window allows one more call, as a delay from
+        now, and the windows' TATs once that call is made.
+        """
+        now = self._clock()
+        at = now
+        for tat, interval, (_, period) in zip(self._tats, self._intervals, self.windows):
+            at = max(at, tat + interval - period)
+        tats = [max(tat, at) + interval for tat, interval in zip(self._tats, self._intervals)]
+        return tats, at - now
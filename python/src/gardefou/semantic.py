@@ -0,0 +1,152 @@
+"""Semantic result cache: answers calls whose prompt means the same as an earlier one."""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+try:  # optional, pip install garde-fou[semantic]
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class SemanticCache:
+    """
+    Cache of results looked up by embedding similarity of the prompt text.
+
+    `embed(text)` is supplied by the user and returns a vector (any sequence
+    of floats, e.g. from a local sentence-transformer or an embeddings API).
+    Vectors are normalized and kept as rows of a preallocated float32 matrix
+    that doubles in size as it fills, so a lookup is one matrix-vector
+    product giving the cosine similarity to every stored prompt. The closest
+    prompt under the same `scope` (e.g. the function) is a hit when its
+    similarity reaches `threshold`.
+
+    Once it holds `max_entries` (DEFAULT_MAX_ENTRIES unless set; None for
+    no bound) the matrix becomes a ring and the oldest entries are
+    overwritten. Lookups scan every entry: see benchmarks/bench_semantic.py
+    for the latency at a given size. With `ttl` an entry stops matching
+    `ttl` seconds after it was stored.
+    """
+
+    DEFAULT_THRESHOLD = 0.95
+    DEFAULT_INITIAL_CAPACITY = 1024
+    DEFAULT_MAX_ENTRIES = 10_000
+
+    def __init__(
+        self,
+        embed: Callable[[str], Any],
+        *,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_entries: Optional[int] = DEFAULT_MAX_ENTRIES,
+        initial_capacity: int = DEFAULT_INITIAL_CAPACITY,
+        ttl: Optional[float] = None,
+        clock: Optional[Callable[[], float]] = None,
+    ):
+        if np is None:
+            raise ImportError("SemanticCache requires numpy: pip install garde-fou[semantic]")
+        if not -1 <= threshold <= 1:
+            raise ValueError(f"threshold must be a cosine similarity in [-1, 1], got {threshold}")
+        self._embed = embed
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock or time.monotonic
+        self._capacity = min(initial_capacity, max_entries) if max_entries else initial_capacity
+        self._lock = threading.Lock()
+
+        # allocated on the first put, once the embedding size is known
+        self._vectors = None
+        self._scopes = np.zeros(self._capacity, dtype=np.int64)
+        self._expires = np.full(self._capacity, np.inf)
+        self._values: List[Any] = [None] * self._capacity
+        self._scope_ids: Dict[Hashable, int] = {}
+        self._size = 0
+        self._next = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def embed(self, text: str):
+        """Normalized float32 embedding of `text`."""
+        vector = np.asarray(self._embed(text), dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def lookup(self, scope: Hashable, vector) -> Tuple[bool, Any]:
+        """
+        Return (True, result) for the most similar unexpired prompt under
+        `scope` if it reaches the threshold, else (False, None). `vector`
+        comes from embed().
+        """
+        with self._lock:
+            scope_id = self._scope_ids.get(scope)
+            if scope_id is None or self._size == 0:
+                self.misses += 1
+                return False, None
+            n = self._size
+            scores = self._vectors[:n] @ vector
+            if len(self._scope_ids) > 1:
+                scores[self._scopes[:n] != scope_id] = -np.inf
+            if self.ttl is not None:
+                scores[self._expires[:n] <= self._clock()] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            return True, self._values[best]
+
+    def put(self, scope: Hashable, vector, value: Any):
+        """Store `value` for a prompt embedded as `vector` (from embed())."""
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self._capacity, len(vector)), dtype=np.float32)
+            elif len(vector) != self._vectors.shape[1]:
+                raise ValueError(f"embedding size changed from {self._vectors.shape[1]} to {len(vector)}")
+            if self._next == self._capacity:
+                if self.max_entries is None or self._capacity < self.max_entries:
+                    self._grow()
+                else:
+                    self._next = 0
+            row = self._next
+            if row < self._size:
+                self.evictions += 1
+            self._vectors[row] = vector
+            self._scopes[row] = self._scope_ids.setdefault(scope, len(self._scope_ids))
+            if self.ttl is not None:
+                self._expires[row] = self._clock() + self.ttl
+            self._values[row] = value
+            self._next += 1
+            self._size = max(self._size, self._next)
+
+    def clear(self):
+        with self._lock:
+            self._values = [None] * self._capacity
+            self._size = 0
+            self._next = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "semantic_entries": self._size,
+            "semantic_hits": self.hits,
+            "semantic_misses": self.misses,
+            "semantic_evictions": self.evictions,
+        }
+
+    def _grow(self):
+        capacity = self._capacity * 2
+        if self.max_entries is not None:
+            capacity = min(capacity, self.max_entries)
+        vectors = np.zeros((capacity, self._vectors.shape[1]), dtype=np.float32)
+        vectors[:self._capacity] = self._vectors
+        scopes = np.zeros(capacity, dtype=np.int64)
+        scopes[:self._capacity] = self._scopes
+        expires = np.full(capacity, np.inf)
+        expires[:self._capacity] = self._expires
+        self._vectors, self._scopes, self._expires = vectors, scopes, expires
+        self._values.extend([None] * (capacity - self._capacity))
+        self._capacity = capacity
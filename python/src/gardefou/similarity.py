@@ -0,0 +1,224 @@
+"""Near-duplicate detection of prompt text with MinHash and LSH banding."""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+_MASK = (1 << 64) - 1
+# odd 64-bit constant used to spread values borrowed by empty bins
+_SPREAD = 0x9E3779B97F4A7C15
+
+
+def extract_text(args: tuple = (), kwargs: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Concatenate every string found in the call arguments, including strings
+    nested in lists, tuples and dict values (e.g. chat message contents).
+    """
+    return "\n".join(_iter_strings(args, kwargs or {}))
+
+
+def _iter_strings(*values: Any) -> Iterator[str]:
+    stack = list(reversed(values))
+    while stack:
+        value = stack.pop()
+        if isinstance(value, str):
+            yield value
+        elif isinstance(value, dict):
+            stack.extend(reversed(list(value.values())))
+        elif isinstance(value, (list, tuple)):
+            stack.extend(reversed(value))
+
+
+def _choose_bands(num_perm: int, threshold: float, recall: float = 0.99) -> Tuple[int, int]:
+    """
+    Pick (bands, rows) for LSH banding: the most rows per band (fewest stray
+    candidates) that still surfaces a pair at exactly `threshold` with
+    probability `recall`. Candidates are verified afterwards, so erring on
+    the side of recall costs time, not accuracy.
+    """
+    candidates = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+
+    def hit_probability(br: Tuple[int, int]) -> float:
+        bands, rows = br
+        return 1 - (1 - threshold ** rows) ** bands
+
+    good = [br for br in candidates if hit_probability(br) >= recall]
+    if good:
+        return max(good, key=lambda br: br[1])
+    return max(candidates, key=hit_probability)
+
+
+class MinHashLSH:
+    """
+    In-memory index answering "was a similar text seen before?".
+
+    Texts are normalized (whitespace collapsed), split into character
+    shingles and summarized by a `num_perm`-value MinHash signature built with
+    one-permutation hashing, so signing costs one hash per shingle. Signatures
+    are split into bands; texts sharing any band are candidates, and a
+    candidate matches when its estimated Jaccard similarity reaches
+    `threshold`. Lookups only touch the candidates' buckets.
+
+    With `ttl` a text is forgotten `ttl` seconds after it was added or last
+    matched, like the exact signature stores.
+
+    Shingle hashes use Python's per-process string hashing, so signatures are
+    only comparable within one process. Safe to share between threads:
+    signing runs unlocked, only the lookup and insert are serialized.
+    """
+
+    def __init__(
+        self,
+        *,
+        threshold: float = 0.9,
+        num_perm: int = 128,
+        shingle_size: int = 5,
+        max_entries: Optional[int] = None,
+        ttl: Optional[float] = None,
+        clock: Optional[Callable[[], float]] = None,
+    ):
+        if not 0 < threshold <= 1:
+            raise ValueError(f"threshold must be in (0, 1], got {threshold}")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock or time.monotonic
+        self.bands, self.rows = _choose_bands(num_perm, threshold)
+
+        self._next_id = 0
+        # id -> (signature, band keys, expires_at, key), least recently matched first
+        self._entries: "OrderedDict[int, Tuple[Tuple[int, ...], List[Hashable], Optional[float], Hashable]]" = OrderedDict()
+        self._buckets: Dict[Hashable, List[int]] = {}
+        # caller's key -> id, for discard()
+        self._ids: Dict[Hashable, int] = {}
+        self.matches = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        """MinHash signature of `text` (one-permutation hashing with densification)."""
+        text = " ".join(text.split())
+        k = self.shingle_size
+        shingles = {text[i:i + k] for i in range(max(1, len(text) - k + 1))}
+        bins = self.num_perm
+        mins = [None] * bins
+        for shingle in shingles:
+            h = hash(shingle) & _MASK
+            slot = h % bins
+            value = h // bins
+            current = mins[slot]
+            if current is None or value < current:
+                mins[slot] = value
+        # densify: an empty bin borrows from the next non-empty one
+        for slot in range(bins):
+            if mins[slot] is None:
+                offset = 1
+                while mins[(slot + offset) % bins] is None:
+                    offset += 1
+                mins[slot] = (mins[(slot + offset) % bins] + offset * _SPREAD) & _MASK
+        return tuple(mins)
+
+    def check_and_add(self, scope: Hashable, text: str, key: Optional[Hashable] = None) -> Optional[float]:
+        """
+        Look up `text` among texts previously added under the same `scope`
+        (e.g. a function name), then add it, under `key` if given so that
+        discard(key) can remove it again.
+
+        Returns the estimated similarity of the closest match at or above the
+        threshold, or None when there is no such match. A matched text is not
+        added, so repeats keep being compared against the original, whose TTL
+        restarts.
+        """
+        sig = self.signature(text)
+        rows = self.rows
+        keys = [(scope, band, hash(sig[band * rows:(band + 1) * rows])) for band in range(self.bands)]
+        with self._lock:
+            return self._match_or_insert(sig, keys, key)
+
+    def discard(self, key: Hashable) -> bool:
+        """Forget the text added under `key`; return whether there was one."""
+        with self._lock:
+            entry_id = self._ids.get(key)
+            if entry_id is None:
+                return False
+            self._remove(entry_id)
+            return True
+
+    def _match_or_insert(self, sig: Tuple[int, ...], keys: List[Hashable], key: Optional[Hashable]) -> Optional[float]:
+        now = self._clock()
+        if self.ttl is not None:
+            self._expire(now)
+        expires_at = now + self.ttl if self.ttl is not None else None
+        best = best_id = None
+        seen = set()
+        for band_key in keys:
+            for entry_id in self._buckets.get(band_key, ()):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                other = self._entries[entry_id][0]
+                similarity = sum(a == b for a, b in zip(sig, other)) / self.num_perm
+                if similarity >= self.threshold and (best is None or similarity > best):
+                    best, best_id = similarity, entry_id
+
+        if best is None:
+            self._insert(sig, keys, expires_at, key)
+        else:
+            self.matches += 1
+            other, other_keys, _, other_key = self._entries[best_id]
+            self._entries[best_id] = (other, other_keys, expires_at, other_key)
+            self._entries.move_to_end(best_id)
+        return best
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._ids.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "near_duplicate_entries": len(self._entries),
+            "near_duplicate_matches": self.matches,
+            "near_duplicate_evictions": self.evictions,
+            "near_duplicate_expirations": self.expirations,
+        }
+
+    def _insert(self, sig: Tuple[int, ...], keys: List[Hashable], expires_at: Optional[float], key: Optional[Hashable]):
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (sig, keys, expires_at, key)
+        if key is not None:
+            self._ids[key] = entry_id
+        for band_key in keys:
+            self._buckets.setdefault(band_key, []).append(entry_id)
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _expire(self, now: float):
+        # every entry shares the TTL, so the least recently matched expires first
+        entries = self._entries
+        while entries:
+            entry_id, (_, _, expires_at, _) = next(iter(entries.items()))
+            if expires_at > now:
+                break
+            self._remove(entry_id)
+            self.expirations += 1
+
+    def _remove(self, entry_id: int):
+        _, keys, _, key = self._entries.pop(entry_id)
+        if key is not None and self._ids.get(key) == entry_id:
+            del self._ids[key]
+        for band_key in keys:
+            bucket = self._buckets[band_key]
+            bucket.remove(entry_id)
+            if not bucket:
+                del self._buckets[band_key]
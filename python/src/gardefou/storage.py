@@ -0,0 +1,392 @@
+"""Signature stores used for duplicate-call detection."""
+
+import math
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+def _sizeof(key: Any) -> int:
+    """Approximate number of bytes retained by a signature key."""
+    size = sys.getsizeof(key)
+    if isinstance(key, tuple):
+        size += sum(sys.getsizeof(part) for part in key)
+    return size
+
+
+class SignatureStore:
+    """
+    Bounded set of call signatures with LRU eviction and per-entry TTL.
+
+    Every limit is optional; with none set the store behaves like a plain set.
+      - max_entries: evict the least recently seen signature beyond this count
+      - max_bytes:   evict the least recently seen signatures beyond this size
+      - ttl:         forget a signature `ttl` seconds after it was last seen
+
+    Entries are kept in last-seen order, and since every entry shares the same
+    TTL that is also expiry order, so lookups and expiry are O(1) amortized.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        clock: Optional[Callable[[], float]] = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock or time.monotonic
+
+        # signature -> (expires_at, size)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        if self.ttl is not None:
+            self._expire(self._clock())
+        return key in self._entries
+
+    def check_and_add(self, key: Hashable) -> bool:
+        """
+        Record `key` as seen and return whether it had been seen before.
+
+        A repeated key is refreshed: it becomes the most recently used entry
+        and its TTL restarts.
+        """
+        now = self._clock()
+        if self.ttl is not None:
+            self._expire(now)
+        expires_at = now + self.ttl if self.ttl is not None else None
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries[key] = (expires_at, entry[1])
+            self._entries.move_to_end(key)
+            return True
+
+        size = _sizeof(key)
+        self._entries[key] = (expires_at, size)
+        self._bytes += size
+        self._evict()
+        return False
+
+    def discard(self, key: Hashable) -> bool:
+        """Forget `key`; return whether it was stored."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= entry[1]
+        return True
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "signatures": len(self._entries),
+            "signature_bytes": self._bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _expire(self, now: float):
+        entries = self._entries
+        while entries:
+            key, (expires_at, size) = next(iter(entries.items()))
+            if expires_at > now:
+                break
+            entries.popitem(last=False)
+            self._bytes -= size
+            self.expirations += 1
+
+    def _evict(self):
+        entries = self._entries
+        while entries and (
+            (self.max_entries is not None and len(entries) > self.max_entries)
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            _, (_, size) = entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+
+class WindowedSignatureStore:
+    """
+    Signature store that only remembers signatures seen in the last `window`
+    seconds.
+
+    Time is cut into `buckets` slots of window/buckets seconds, each holding
+    the set of signatures seen during it. Expiry drops whole slots at once,
+    so no per-entry bookkeeping is needed and memory follows the traffic
+    inside the window. A signature is remembered for at least `window` and
+    at most one extra slot after it was last seen.
+    """
+
+    def __init__(self, window: float, *, buckets: int = 10, clock: Optional[Callable[[], float]] = None):
+        if window <= 0:
+            raise ValueError(f"window must be positive, got {window}")
+        if buckets < 1:
+            raise ValueError(f"buckets must be at least 1, got {buckets}")
+        self.window = window
+        self.buckets = buckets
+        self._width = window / buckets
+        self._clock = clock or time.monotonic
+        # (slot number, signatures seen during that slot), oldest first
+        self._ring: "deque[tuple]" = deque()
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return sum(len(keys) for _, keys in self._ring)
+
+    def __contains__(self, key: Hashable) -> bool:
+        self._expire(self._slot())
+        return any(key in keys for _, keys in self._ring)
+
+    def check_and_add(self, key: Hashable) -> bool:
+        """Record `key` in the current slot and return whether it was seen within the window."""
+        slot = self._slot()
+        self._expire(slot)
+        seen = any(key in keys for _, keys in self._ring)
+        if not self._ring or self._ring[-1][0] != slot:
+            self._ring.append((slot, set()))
+        self._ring[-1][1].add(key)
+        return seen
+
+    def discard(self, key: Hashable) -> bool:
+        """Forget `key` from every slot; return whether it was stored."""
+        found = False
+        for _, keys in self._ring:
+            if key in keys:
+                keys.discard(key)
+                found = True
+        return found
+
+    def clear(self):
+        self._ring.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "signatures": len(self),
+            "buckets": len(self._ring),
+            "expirations": self.expirations,
+        }
+
+    def _slot(self) -> int:
+        return int(self._clock() // self._width)
+
+    def _expire(self, slot: int):
+        ring = self._ring
+        oldest_kept = slot - self.buckets
+        while ring and ring[0][0] < oldest_kept:
+            _, keys = ring.popleft()
+            self.expirations += len(keys)
+
+
+class _BloomFilter:
+    """Fixed-size Bloom filter over 16-byte digests using double hashing."""
+
+    __slots__ = ("bits", "num_bits", "num_hashes", "capacity", "count", "bits_set")
+
+    def __init__(self, num_bits: int, num_hashes: int, capacity: int):
+        self.bits = bytearray((num_bits + 7) // 8)
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.capacity = capacity
+        self.count = 0
+        self.bits_set = 0
+
+    def _positions(self, key: bytes):
+        h1 = int.from_bytes(key[:8], "little")
+        h2 = int.from_bytes(key[8:16], "little") | 1
+        m = self.num_bits
+        return [(h1 + i * h2) % m for i in range(self.num_hashes)]
+
+    def __contains__(self, key: bytes) -> bool:
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def add(self, key: bytes):
+        bits = self.bits
+        for pos in self._positions(key):
+            mask = 1 << (pos & 7)
+            if not bits[pos >> 3] & mask:
+                bits[pos >> 3] |= mask
+                self.bits_set += 1
+        self.count += 1
+
+    def false_positive_rate(self) -> float:
+        return (self.bits_set / self.num_bits) ** self.num_hashes
+
+
+class BloomSignatureStore:
+    """
+    Probabilistic signature store: a scalable Bloom filter under a byte cap.
+
+    Keys must be digests of at least 16 bytes (see fingerprint.fingerprint).
+    A new call may be reported as a duplicate with a small probability, but a
+    real duplicate is never missed.
+
+    Filters are added as the previous one fills, each with a tighter error
+    rate so the compound false-positive rate stays near `error_rate`. Once
+    `max_bytes` is reached no more filters are added and the last one keeps
+    absorbing keys; its false-positive rate then rises, which stats() reports.
+    """
+
+    GROWTH = 2
+    TIGHTENING = 0.5
+    DEFAULT_ERROR_RATE = 0.001
+    DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+    DEFAULT_INITIAL_CAPACITY = 100_000
+
+    def __init__(
+        self,
+        *,
+        error_rate: float = DEFAULT_ERROR_RATE,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        initial_capacity: int = DEFAULT_INITIAL_CAPACITY,
+    ):
+        if not 0 < error_rate < 1:
+            raise ValueError(f"error_rate must be between 0 and 1, got {error_rate}")
+        self.error_rate = error_rate
+        self.max_bytes = max_bytes
+        self.initial_capacity = initial_capacity
+        self._filters = []
+        self._saturated = False
+        self._add_filter(initial_capacity)
+        if not self._filters:
+            raise ValueError(f"max_bytes={max_bytes} is too small for a Bloom filter")
+
+    def __len__(self) -> int:
+        """Number of distinct keys inserted (approximate: false positives are not counted)."""
+        return sum(f.count for f in self._filters)
+
+    def __contains__(self, key: bytes) -> bool:
+        return any(key in f for f in self._filters)
+
+    def check_and_add(self, key: bytes) -> bool:
+        """Record `key` as seen and return whether it was (probably) seen before."""
+        if key in self:
+            return True
+        current = self._filters[-1]
+        if current.count >= current.capacity and not self._saturated:
+            self._add_filter(current.capacity * self.GROWTH)
+            current = self._filters[-1]
+        current.add(key)
+        return False
+
+    def discard(self, key: bytes) -> bool:
+        """Bloom filters cannot forget a key: always returns False."""
+        return False
+
+    def clear(self):
+        self._filters = []
+        self._saturated = False
+        self._add_filter(self.initial_capacity)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(f.bits) for f in self._filters)
+
+    def stats(self) -> Dict[str, Any]:
+        miss = 1.0
+        for f in self._filters:
+            miss *= 1.0 - f.false_positive_rate()
+        bits_set = sum(f.bits_set for f in self._filters)
+        num_bits = sum(f.num_bits for f in self._filters)
+        return {
+            "signatures": len(self),
+            "signature_bytes": self.nbytes,
+            "filters": len(self._filters),
+            "saturated": self._saturated,
+            "estimated_fpr": 1.0 - miss,
+            "fill_ratio": bits_set / num_bits,
+        }
+
+    def _add_filter(self, capacity: int):
+        """Append a filter for `capacity` keys, shrunk to fit the byte budget."""
+        error = self.error_rate * (1 - self.TIGHTENING) * self.TIGHTENING ** len(self._filters)
+        bits_per_key = -math.log(error) / (math.log(2) ** 2)
+        num_bits = math.ceil(capacity * bits_per_key)
+        budget_bits = (self.max_bytes - self.nbytes) * 8
+        if num_bits > budget_bits:
+            capacity = int(budget_bits / bits_per_key)
+            num_bits = budget_bits
+        if capacity < 1:
+            # out of budget: the last filter keeps absorbing keys
+            self._saturated = True
+            return
+        num_hashes = max(1, math.ceil(-math.log2(error)))
+        self._filters.append(_BloomFilter(num_bits, num_hashes, capacity))
+
+
+class ShardedSignatureStore:
+    """
+    Thread-safe signature store made of independently locked shards.
+
+    A key always lands in the same shard (chosen from its first byte, so keys
+    should be digests), and threads only contend when they touch the same
+    shard. Size limits passed through `factory` apply per shard.
+    """
+
+    def __init__(self, factory: Callable[[], Any], shards: int = 16):
+        if shards < 1:
+            raise ValueError(f"shards must be at least 1, got {shards}")
+        self._shards = [factory() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+
+    def _index(self, key: bytes) -> int:
+        return key[0] % len(self._shards) if key else 0
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def __contains__(self, key: bytes) -> bool:
+        i = self._index(key)
+        with self._locks[i]:
+            return key in self._shards[i]
+
+    def check_and_add(self, key: bytes) -> bool:
+        """Atomically record `key` and return whether it had been seen before."""
+        i = self._index(key)
+        with self._locks[i]:
+            return self._shards[i].check_and_add(key)
+
+    def discard(self, key: bytes) -> bool:
+        """Forget `key` if the underlying store can; return whether it was stored."""
+        i = self._index(key)
+        with self._locks[i]:
+            return self._shards[i].discard(key)
+
+    def clear(self):
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                shard.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Shard stats combined: counts summed, rates averaged, flags or-ed."""
+        per_shard = []
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                per_shard.append(shard.stats())
+        combined: Dict[str, Any] = {}
+        for name, value in per_shard[0].items():
+            values = [stats[name] for stats in per_shard]
+            if isinstance(value, bool):
+                combined[name] = any(values)
+            elif isinstance(value, float):
+                combined[name] = sum(values) / len(values)
+            else:
+                combined[name] = sum(values)
+        combined["shards"] = len(self._shards)
+        return combined
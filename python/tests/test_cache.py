@@ -0,0 +1,259 @@
+"""
+TEST MATRIX for result caches:
+
+| Cache       | limits              | Expected Behavior                                    |
+|-------------|---------------------|------------------------------------------------------|
+| ResultCache | none                | Stores and returns results, counts hits and misses   |
+| ResultCache | max_entries=2       | Least recently used result is evicted first          |
+| ResultCache | max_bytes           | Evicts until estimated size fits the budget          |
+| ResultCache | ttl=10              | Result expires 10s after it was stored               |
+| ResultCache | policy="gds"        | Evicts least cost per byte, aged by inflation L      |
+| ResultCache | cost=               | Hits add the entry's cost to cache_cost_saved        |
+| ResultCache | admission="tinylfu" | One-off calls do not flush reused results            |
+| Sketch      | width=16            | Estimates never undercount, halve after aging        |
+| DiskCache   | none                | Results survive a new instance, files under algo dir |
+| DiskCache   | mmap_threshold=0    | Large entries unpickled from a memory map            |
+| DiskCache   | out-of-band buffers | Returned as read-only views into the map, no copy    |
+| DiskCache   | max_bytes, ttl      | Sweep removes expired, then least recently used      |
+| DiskCache   | corrupt / unpicklable | Treated as a miss / skipped with a warning         |
+"""
+
+import mmap
+import os
+import pickle
+import threading
+import time
+import tracemalloc
+
+import pytest
+
+from gardefou.cache import DiskCache, ResultCache, _CountMinSketch, estimate_size
+from gardefou.fingerprint import HASH_ALGORITHM
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lookup_hit_and_miss():
+    cache = ResultCache()
+    assert cache.lookup(b"k") == (False, None)
+    cache.put(b"k", None)
+    # a cached None is still a hit
+    assert cache.lookup(b"k") == (True, None)
+    assert cache.get(b"other", "default") == "default"
+    stats = cache.stats()
+    assert stats["cache_hits"] == 1
+    assert stats["cache_misses"] == 2
+    assert stats["cache_entries"] == 1
+
+def test_max_entries_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.lookup("b") == (False, None)
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["cache_evictions"] == 1
+
+def test_max_bytes_bounds_estimated_size():
+    cache = ResultCache(max_bytes=10_000)
+    for i in range(100):
+        cache.put(i, "x" * 1000 + str(i))
+    stats = cache.stats()
+    assert stats["cache_bytes"] <= 10_000
+    assert 0 < stats["cache_entries"] < 100
+    assert cache.get(99).endswith("99")
+
+def test_ttl_expires_results():
+    clock = FakeClock()
+    cache = ResultCache(ttl=10, clock=clock)
+    cache.put("a", "result")
+    clock.now = 9.9
+    assert cache.get("a") == "result"
+    clock.now = 10
+    assert cache.lookup("a") == (False, None)
+    assert cache.stats()["cache_expirations"] == 1
+    assert len(cache) == 0
+
+def test_estimate_size_counts_nested_values():
+    payload = {"choices": [{"text": "y" * 5000}]}
+    assert estimate_size(payload) > 5000
+    shared = "z" * 5000
+    assert estimate_size([shared, shared]) < 2 * 5000
+
+def test_gds_keeps_expensive_entries_over_recent_cheap_ones():
+    cache = ResultCache(max_entries=3, policy="gds", sizeof=lambda v: 100)
+    cache.put("completion", "c", cost=0.40)
+    for i in range(10):
+        cache.put(f"embedding{i}", "e", cost=0.0001)
+    assert cache.get("completion") == "c"
+    assert len(cache) == 3
+    # an lru cache would have evicted it long ago
+    lru = ResultCache(max_entries=3, sizeof=lambda v: 100)
+    lru.put("completion", "c", cost=0.40)
+    for i in range(10):
+        lru.put(f"embedding{i}", "e", cost=0.0001)
+    assert lru.lookup("completion") == (False, None)
+
+def test_gds_prefers_small_entries_at_equal_cost():
+    cache = ResultCache(max_bytes=1000, policy="gds", sizeof=len)
+    cache.put("big", "x" * 600, cost=1)
+    cache.put("small", "y" * 100, cost=1)
+    cache.put("medium", "z" * 400, cost=1)
+    assert cache.lookup("big") == (False, None)
+    assert cache.get("small") and cache.get("medium")
+
+def test_gds_ages_out_expensive_entries_never_hit_again():
+    cache = ResultCache(max_entries=2, policy="gds", sizeof=lambda v: 1)
+    cache.put("expensive", 0, cost=5)
+    # each eviction raises L, so fresh cheap entries eventually outrank it
+    for i in range(20):
+        cache.put(i, i, cost=1)
+        cache.get(i)
+    assert cache.lookup("expensive") == (False, None)
+
+def test_cost_saved_counter():
+    cache = ResultCache()
+    cache.put("a", 1, cost=0.25)
+    cache.get("a")
+    cache.get("a")
+    cache.get("missing")
+    stats = cache.stats()
+    assert stats["cache_cost_saved"] == 0.5
+    assert stats["cache_hit_rate"] == 2 / 3
+
+def test_tinylfu_keeps_hot_results_through_one_off_scan():
+    def replay(cache):
+        hot_hits = 0
+        for i in range(2000):
+            for key in (f"hot{i % 50}", f"once{i}"):
+                hit, _ = cache.lookup(key)
+                if not hit:
+                    cache.put(key, key)
+                elif key.startswith("hot"):
+                    hot_hits += 1
+        return hot_hits
+
+    lru = ResultCache(max_entries=60)
+    tinylfu = ResultCache(max_entries=60, admission="tinylfu")
+    assert replay(tinylfu) > replay(lru) + 500
+    assert len(tinylfu) <= 60
+    assert tinylfu.stats()["cache_rejections"] > 0
+
+def test_tinylfu_window_serves_fresh_results():
+    cache = ResultCache(max_entries=100, admission="tinylfu")
+    cache.put("new", 1)
+    assert cache.get("new") == 1
+
+def test_tinylfu_requires_a_limit():
+    with pytest.raises(ValueError):
+        ResultCache(admission="tinylfu")
+
+def test_count_min_sketch_ages_counts():
+    sketch = _CountMinSketch(16)
+    for _ in range(10):
+        sketch.increment("a")
+    assert sketch.estimate("a") >= 10
+    assert sketch.estimate("never") <= 10
+    for i in range(10 * sketch.width):
+        sketch.increment(i)
+    assert sketch.estimate("a") < 10
+
+def test_disk_cache_persists_across_instances(tmp_path):
+    key = bytes(range(16))
+    DiskCache(tmp_path).put(key, {"text": "hello"})
+    cache = DiskCache(tmp_path)
+    assert cache.lookup(key) == (True, {"text": "hello"})
+    assert cache.lookup(bytes(16)) == (False, None)
+    path = cache.path(key)
+    assert path.parent.parent == tmp_path / HASH_ALGORITHM
+    assert path.parent.name == key.hex()[:2]
+    # no temporary files left behind
+    assert [p.name for p in path.parent.iterdir()] == [path.name]
+
+def test_disk_cache_maps_large_entries(tmp_path):
+    cache = DiskCache(tmp_path, mmap_threshold=0)
+    cache.put(b"k" * 16, b"x" * 100_000)
+    assert cache.get(b"k" * 16) == b"x" * 100_000
+
+def test_disk_cache_maps_out_of_band_buffers_without_copy(tmp_path):
+    cache = DiskCache(tmp_path, mmap_threshold=0)
+    payload = bytes(range(256)) * 40_000
+    cache.put(b"k" * 16, {"audio": pickle.PickleBuffer(payload), "n": 1})
+    tracemalloc.start()
+    value = cache.get(b"k" * 16)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < len(payload) // 10
+    view = memoryview(value["audio"])
+    assert isinstance(view.obj, mmap.mmap) and view.readonly
+    assert view == payload and value["n"] == 1
+
+def test_disk_cache_maps_numpy_arrays_without_copy(tmp_path):
+    np = pytest.importorskip("numpy")
+    cache = DiskCache(tmp_path, mmap_threshold=0)
+    array = np.arange(1_000_000, dtype=np.float64).reshape(1000, 1000)
+    cache.put(b"a" * 16, array)
+    cached = cache.get(b"a" * 16)
+    assert np.array_equal(cached, array)
+    assert not cached.flags.writeable
+    assert cached.ctypes.data % 64 == 0
+
+def test_disk_cache_sweep_expires_then_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=2500, ttl=100)
+    keys = [bytes([i]) * 16 for i in range(4)]
+    for key in keys:
+        cache.put(key, "v" * 1000)
+    now = time.time()
+    paths = [cache.path(key) for key in keys]
+    os.utime(paths[0], (now - 200, now - 200))  # expired
+    os.utime(paths[1], (now - 10, now - 50))    # least recently used
+    os.utime(paths[2], (now - 5, now - 50))
+    cache.sweep()
+    assert [p.exists() for p in paths] == [False, False, True, True]
+    stats = cache.stats()
+    assert stats["cache_expirations"] == 1
+    assert stats["cache_evictions"] == 1
+    assert stats["cache_entries"] == 2
+    assert stats["cache_bytes"] <= 2500
+    cache.close()
+
+def test_disk_cache_reports_expired_entry_as_miss(tmp_path):
+    cache = DiskCache(tmp_path, ttl=100)
+    cache.put(b"a" * 16, 1)
+    old = time.time() - 200
+    os.utime(cache.path(b"a" * 16), (old, old))
+    assert cache.lookup(b"a" * 16) == (False, None)
+    cache.close()
+
+def test_disk_cache_corrupt_and_unpicklable(tmp_path, caplog):
+    cache = DiskCache(tmp_path)
+    cache.put(b"c" * 16, "ok")
+    cache.path(b"c" * 16).write_bytes(b"not a pickle")
+    assert cache.lookup(b"c" * 16) == (False, None)
+    cache.put(b"d" * 16, threading.Lock())
+    assert "cannot pickle" in caplog.text
+    assert cache.lookup(b"d" * 16) == (False, None)
+
+def test_disk_cache_concurrent_writers(tmp_path):
+    cache = DiskCache(tmp_path)
+    key = b"w" * 16
+
+    def write(i):
+        for _ in range(20):
+            cache.put(key, [i] * 1000)
+            hit, value = cache.lookup(key)
+            assert hit and len(set(value)) == 1
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(cache) == 1
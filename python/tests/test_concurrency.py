@@ -0,0 +1,104 @@
+"""
+TEST MATRIX for the concurrency limiter:
+
+| Scenario             | limit | Expected Behavior                                         |
+|----------------------|-------|-----------------------------------------------------------|
+| Threads              | 3     | Never more than 3 holders, all 20 threads get through     |
+| Timeout              | 1     | acquire(timeout) gives up and leaves no waiter behind      |
+| Coroutines           | 2     | Never more than 2 holders, FIFO hand-over                 |
+| Threads + coroutines | 1     | A thread release wakes a coroutine on another thread's loop |
+| Cancelled waiter     | 1     | Cancelling a waiting coroutine does not leak the slot     |
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from gardefou.concurrency import ConcurrencyLimiter
+
+
+def test_threads_never_exceed_limit():
+    limiter = ConcurrencyLimiter(3)
+    peak = []
+    lock = threading.Lock()
+
+    def worker():
+        limiter.acquire()
+        try:
+            with lock:
+                peak.append(limiter.active)
+            time.sleep(0.005)
+        finally:
+            limiter.release()
+
+    threads = [threading.Thread(target=worker) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(peak) == 20
+    assert max(peak) <= 3
+    assert limiter.active == 0
+
+def test_acquire_timeout():
+    limiter = ConcurrencyLimiter(1)
+    limiter.acquire()
+    assert limiter.acquire(timeout=0.01) is False
+    limiter.release()
+    assert limiter.acquire(timeout=0.01) is True
+
+@pytest.mark.asyncio
+async def test_coroutines_served_in_order():
+    limiter = ConcurrencyLimiter(2)
+    order = []
+
+    async def worker(i):
+        await limiter.acquire_async()
+        try:
+            assert limiter.active <= 2
+            order.append(i)
+            await asyncio.sleep(0.001)
+        finally:
+            limiter.release()
+
+    await asyncio.gather(*(worker(i) for i in range(10)))
+    assert order == list(range(10))
+    assert limiter.active == 0
+    assert limiter.waited == 8
+
+def test_thread_release_wakes_coroutine_on_other_loop():
+    limiter = ConcurrencyLimiter(1)
+    limiter.acquire()
+    got_slot = threading.Event()
+
+    async def waiter():
+        await limiter.acquire_async()
+        got_slot.set()
+        limiter.release()
+
+    thread = threading.Thread(target=asyncio.run, args=(waiter(),))
+    thread.start()
+    while limiter.waited == 0:
+        time.sleep(0.001)
+    assert not got_slot.is_set()
+    limiter.release()
+    thread.join(5)
+    assert got_slot.is_set()
+    assert limiter.active == 0
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_slot():
+    limiter = ConcurrencyLimiter(1)
+    await limiter.acquire_async()
+    waiting = asyncio.ensure_future(limiter.acquire_async())
+    await asyncio.sleep(0)
+    # hand the slot over and cancel before the waiter resumes
+    limiter.release()
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    await asyncio.sleep(0)
+    assert limiter.active == 0
+    await asyncio.wait_for(limiter.acquire_async(), 1)
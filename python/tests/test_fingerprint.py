@@ -0,0 +1,198 @@
+"""
+TEST MATRIX for call fingerprints:
+
+| Scenario                        | Expected Behavior                          |
+|---------------------------------|--------------------------------------------|
+| Any call                        | Digest is always DIGEST_SIZE bytes         |
+| Same call twice                 | Same digest                                |
+| kwargs in a different order     | Same digest                                |
+| Different fn name / args        | Different digest                           |
+| Nested dicts in any key order   | Same digest                                |
+| 1 vs "1" vs 1.0 vs True         | Different digests                          |
+| Objects with a default repr     | Fingerprinted by state, not memory address |
+| ... and no visible state        | Fingerprinted by identity                  |
+| Dataclass / model_dump objects  | Fingerprinted by compared fields / dump    |
+| register_fingerprinter(cls, fn) | fn(obj) is fingerprinted in obj's place    |
+| NumPy arrays (if installed)     | Fingerprinted by dtype, shape and data     |
+| bytes / bytearray / memoryview  | Same content, same digest                  |
+| 20 MB bytes payload             | Hashed in place, no copy                   |
+| Several large buffers           | Hashed in parallel, order preserved        |
+| Paths / open files              | By name, or by content if file_contents    |
+| io.BytesIO                      | Always by buffer content                   |
+| Scalar calls / chat messages    | Fast paths match the general encoding      |
+"""
+
+import io
+import os
+import sqlite3
+import tracemalloc
+from dataclasses import dataclass, field
+
+import pytest
+from gardefou.fingerprint import DIGEST_SIZE, fingerprint, register_fingerprinter
+
+
+def test_digest_has_fixed_size():
+    assert len(fingerprint("f", (), {})) == DIGEST_SIZE
+    assert len(fingerprint("f", ("x" * 100_000,), {"k": list(range(1000))})) == DIGEST_SIZE
+
+def test_same_call_same_digest():
+    assert fingerprint("f", (1, "a"), {"x": 2, "y": 3}) == fingerprint("f", (1, "a"), {"y": 3, "x": 2})
+
+def test_different_calls_differ():
+    base = fingerprint("f", (1,), {"x": 2})
+    assert fingerprint("g", (1,), {"x": 2}) != base
+    assert fingerprint("f", (2,), {"x": 2}) != base
+    assert fingerprint("f", (1,), {"x": 3}) != base
+
+def test_nested_dict_order_is_canonical():
+    a = {"messages": [{"role": "user", "content": "hi"}], "opts": {"x": 1, "y": {2: "b", "k": None}}}
+    b = {"opts": {"y": {"k": None, 2: "b"}, "x": 1}, "messages": [{"content": "hi", "role": "user"}]}
+    assert fingerprint("f", (a,), {}) == fingerprint("f", (b,), {})
+
+def test_values_of_different_types_differ():
+    assert fingerprint("f", (1,), {}) != fingerprint("f", ("1",), {})
+    assert fingerprint("f", (1,), {}) != fingerprint("f", (1.0,), {})
+    assert fingerprint("f", (True,), {}) != fingerprint("f", (1,), {})
+    assert fingerprint("f", ([1],), {}) != fingerprint("f", ((1,),), {})
+    assert fingerprint("f", ("ab", "c"), {}) != fingerprint("f", ("a", "bc"), {})
+
+def test_plain_objects_fingerprint_by_state_not_address():
+    class Client:
+        def __init__(self, url):
+            self.url = url
+
+    assert fingerprint("f", (Client("a"),), {}) == fingerprint("f", (Client("a"),), {})
+    assert fingerprint("f", (Client("a"),), {}) != fingerprint("f", (Client("b"),), {})
+
+def test_dataclasses_and_model_like_objects():
+    @dataclass
+    class Query:
+        text: str
+        trace_id: int = field(default=0, compare=False)
+
+    class Model:
+        def __init__(self, **data):
+            self._data = data
+
+        def model_dump(self):
+            return dict(self._data)
+
+    assert fingerprint("f", (Query("q", 1),), {}) == fingerprint("f", (Query("q", 2),), {})
+    assert fingerprint("f", (Model(a=1, b=2),), {}) == fingerprint("f", (Model(b=2, a=1),), {})
+    assert fingerprint("f", (Model(a=1),), {}) != fingerprint("f", (Model(a=2),), {})
+
+def test_self_referencing_list():
+    items = [1]
+    items.append(items)
+    assert len(fingerprint("f", (items,), {})) == DIGEST_SIZE
+
+def test_self_referencing_dict_with_non_str_keys():
+    d = {1: None}
+    d[1] = d
+    assert fingerprint("f", (d,), {}) == fingerprint("f", (d,), {})
+
+def test_file_contents_reach_sets_and_non_str_keys(tmp_path):
+    a, b = tmp_path / "a.wav", tmp_path / "b.wav"
+    a.write_bytes(b"same audio")
+    b.write_bytes(b"same audio")
+    assert fingerprint("f", ({a},), {}, file_contents=True) == fingerprint("f", ({b},), {}, file_contents=True)
+    assert fingerprint("f", ({1: a},), {}, file_contents=True) == fingerprint("f", ({1: b},), {}, file_contents=True)
+
+def test_register_fingerprinter_hook():
+    class Session:
+        def __init__(self, user, request_id):
+            self.user = user
+            self.request_id = request_id
+
+    register_fingerprinter(Session, lambda s: s.user)
+    assert fingerprint("f", (Session("ann", 1),), {}) == fingerprint("f", (Session("ann", 2),), {})
+    assert fingerprint("f", (Session("ann", 1),), {}) != fingerprint("f", (Session("bob", 1),), {})
+
+def test_numpy_arrays():
+    np = pytest.importorskip("numpy")
+    a = np.arange(12, dtype=np.float32).reshape(3, 4)
+    assert fingerprint("f", (a,), {}) == fingerprint("f", (a.copy(),), {})
+    assert fingerprint("f", (a.T,), {}) != fingerprint("f", (a,), {})
+    assert fingerprint("f", (a.astype(np.float64),), {}) != fingerprint("f", (a,), {})
+
+def test_buffer_arguments_hash_by_content():
+    data = b"\x00\x01audio-frame" * 100
+    digest = fingerprint("f", (data,), {})
+    assert fingerprint("f", (bytearray(data),), {}) == digest
+    assert fingerprint("f", (memoryview(data),), {}) == digest
+    assert fingerprint("f", (memoryview(bytearray(data)),), {}) == digest
+    assert fingerprint("f", (data[:-1] + b"!",), {}) != digest
+
+def test_large_buffers_hashed_without_copy():
+    payload = bytes(20 * 1024 * 1024)
+    tracemalloc.start()
+    fingerprint("transcribe", (payload,), {"language": "en"})
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < 1024 * 1024
+
+def test_several_large_buffers_keep_their_order():
+    a, b = b"a" * 4096, b"b" * 4096
+    digest = fingerprint("f", (a, b), {}, large_buffer_threshold=1024)
+    assert fingerprint("f", (bytearray(a), b), {}, large_buffer_threshold=1024) == digest
+    assert fingerprint("f", (b, a), {}, large_buffer_threshold=1024) != digest
+
+def test_paths_compared_by_name_unless_file_contents(tmp_path):
+    a, b = tmp_path / "a.wav", tmp_path / "b.wav"
+    a.write_bytes(b"same audio")
+    b.write_bytes(b"same audio")
+    assert fingerprint("f", (a,), {}) != fingerprint("f", (b,), {})
+    assert fingerprint("f", (a,), {}, file_contents=True) == fingerprint("f", (b,), {}, file_contents=True)
+
+def test_file_contents_track_changes(tmp_path):
+    path = tmp_path / "upload.pdf"
+    path.write_bytes(b"version 1")
+    before = fingerprint("f", (path,), {}, file_contents=True)
+    path.write_bytes(b"version 2, longer")
+    assert fingerprint("f", (path,), {}, file_contents=True) != before
+
+def test_repeat_path_check_does_not_open_file(tmp_path, monkeypatch):
+    path = tmp_path / "talk.wav"
+    path.write_bytes(b"recording")
+    first = fingerprint("f", (path,), {}, file_contents=True)
+    opened = []
+    real_open = os.open
+    monkeypatch.setattr(os, "open", lambda *args, **kwargs: opened.append(args) or real_open(*args, **kwargs))
+    assert fingerprint("f", (path,), {}, file_contents=True) == first
+    assert opened == []
+
+def test_open_files_fingerprint_by_content(tmp_path):
+    path = tmp_path / "clip.mp3"
+    path.write_bytes(b"\x00" * 1000)
+    with open(path, "rb") as f1, open(path, "rb") as f2:
+        f2.read(10)  # file position does not matter
+        assert fingerprint("f", (f1,), {}, file_contents=True) == fingerprint("f", (f2,), {}, file_contents=True)
+        assert fingerprint("f", (f1,), {}, file_contents=True) == fingerprint("f", (io.BytesIO(b"\x00" * 1000),), {}, file_contents=True)
+
+def test_objects_without_visible_state_fingerprint_by_identity():
+    first, second = sqlite3.connect(":memory:"), sqlite3.connect(":memory:")
+    try:
+        assert fingerprint("f", (first,), {}) != fingerprint("f", (second,), {})
+        assert fingerprint("f", (first,), {}) == fingerprint("f", (first,), {})
+    finally:
+        first.close()
+        second.close()
+
+def test_bytesio_always_fingerprints_by_content():
+    assert fingerprint("f", (io.BytesIO(b"audio one"),), {}) != fingerprint("f", (io.BytesIO(b"different"),), {})
+    assert fingerprint("f", (io.BytesIO(b"same"),), {}) == fingerprint("f", (io.BytesIO(b"same"),), {})
+
+
+def test_fast_paths_match_general_encoding():
+    class Args(tuple):
+        pass
+
+    class Message(dict):
+        pass
+
+    args = (1, -7, 2 ** 70, 1.5, "hé", None, True)
+    kwargs = {"model": "gpt-4", "temperature": 0.2}
+    assert fingerprint("f", args, kwargs) == fingerprint("f", Args(args), kwargs)
+    messages = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello \ud800"}]
+    assert fingerprint("f", (messages,), {}) == fingerprint("f", ([Message(m) for m in messages],), {})
@@ -13,12 +13,36 @@ TEST MATRIX for GardeFou wrapper:
 | Async duplicate raise            | GardeFou(on_violation_duplicate_call="raise") | 2 identical async calls, 2nd raises           |
 | Profile pass-through             | guard = GardeFou(profile=Profile(max_calls=1))| uses provided Profile                        |
 | Custom callback                  | GardeFou(on_violation="callback")             | invokes callback on breach                    |
+| Per-function dedup rule          | GardeFou(dedup_ignore={fn: ["request_id"]})   | only fn ignores request_id                    |
+| Coalesce (threads / coroutines)  | GardeFou(on_violation_duplicate_call="coalesce") | in-flight duplicates share one call        |
+| Large duplicate payload          | "coalesce" / "warn", 20 MiB bytes argument    | no repr built; warning summarizes the bytes   |
+| Cache (sync / async)             | GardeFou(on_violation_duplicate_call="cache") | repeats answered from cache, fn not called    |
+| Cache without limits             | GardeFou(on_violation_duplicate_call="cache") | bounded by ResultCache.DEFAULT_MAX_BYTES      |
+| Cache priced per function        | cost={fn: 0.4}, cache_policy="gds"            | cache_cost_saved adds up the prices of hits   |
+| Stale-while-revalidate (async)   | cache_stale_after=10, cache_ttl=60            | stale served at once, one background refresh  |
+| Streams (generators)             | on_violation_duplicate_call="cache"           | counted once, replayed chunk by chunk         |
+| Rate limit wait (sync / async)   | rate_limit="10/s", on_violation_rate_limit="wait" | calls delayed to their slot, not failed   |
+| max_concurrent (threads / async) | GardeFou(max_concurrent=2)                    | at most 2 calls in flight, slot freed on end  |
+| Disk cache                       | config={"cache_dir": tmp_path}                | results reused by a new guard (next run)      |
+| Call outcomes (sync / async)     | GardeFou()                                    | completed, failed and cancelled calls counted |
+| Refund on failure                | refund_on=[TimeoutError], max_calls=2         | timed-out calls refunded, retry not a dup     |
+| Cost budget (sync / async)       | max_cost=0.05, cost=0.01, cost_per_token      | estimate reserved, usage committed after call |
+| Cost budget by tokens only       | max_cost=0.5, cost_per_token, estimated_tokens | estimate in dollars, never a call count      |
+| Function kinds                   | methods, partials, generators, AsyncMock      | classified like inspect, once per call        |
 """
 
+import asyncio
+import functools
+import inspect
 import logging
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
-from gardefou import GardeFou, Profile, QuotaExceededError
+from gardefou import GardeFou, Profile, QuotaExceededError, ResultCache
+from gardefou.gardefou import _kind
 
 # A dummy sync function to wrap
 def add(a, b):
@@ -158,4 +182,553 @@ def test_guarded_custom_callback(monkeypatch):
     guard = GardeFou(max_calls=1, on_violation_max_calls=cb)
     assert guard(add, 1, 1) == 2
     guard(add, 2, 2)  # second triggers callback
-    assert called.get('ok') is True
\ No newline at end of file
+    assert called.get('ok') is True
+
+def test_dedup_rules_keyed_by_wrapped_function():
+    """
+    Per-function dedup rules only apply to the function they are keyed by.
+    """
+    def ask(prompt, request_id=None):
+        return prompt
+
+    guard = GardeFou(on_violation_duplicate_call="raise", dedup_ignore={ask: ["request_id"]})
+    guard(ask, "hi", request_id=1)
+    with pytest.raises(QuotaExceededError):
+        guard(ask, "hi", request_id=2)
+    # add has no rule: every argument is compared
+    guard(add, 1, 2)
+    guard(add, 1, 3)
+
+def test_same_name_different_functions_not_duplicates():
+    """
+    Functions that share a __name__ are told apart by their qualified name.
+    """
+    class Chat:
+        def create(self, prompt):
+            return "chat"
+
+    class Embeddings:
+        def create(self, prompt):
+            return "embedding"
+
+    guard = GardeFou(on_violation_duplicate_call="raise")
+    assert guard(Chat().create, "hi") == "chat"
+    assert guard(Embeddings().create, "hi") == "embedding"
+
+def test_coalesce_sync_threads_share_one_call():
+    """
+    Identical calls from several threads while one is running share its result.
+    """
+    calls = []
+    release = threading.Event()
+
+    def slow(prompt):
+        calls.append(prompt)
+        release.wait(5)
+        return prompt.upper()
+
+    guard = GardeFou(on_violation_duplicate_call="coalesce")
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(guard, slow, "hi") for _ in range(8)]
+        while guard.profile.stats()["coalesced"] < 7:
+            time.sleep(0.01)
+        release.set()
+        results = [f.result() for f in futures]
+    assert results == ["HI"] * 8
+    assert calls == ["hi"]
+    # once finished, the next identical call runs again
+    assert guard(slow, "hi") == "HI"
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_coalesce_async_callers_share_task_and_exception():
+    """
+    Concurrent coroutines share one call, including its exception.
+    """
+    calls = []
+
+    async def flaky(prompt):
+        calls.append(prompt)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("provider down")
+
+    guard = GardeFou(max_calls=5, on_violation_duplicate_call="coalesce")
+    results = await asyncio.gather(*(guard(flaky, "p") for _ in range(50)), return_exceptions=True)
+    assert len(calls) == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert guard.profile.call_count == 1
+
+def test_cache_returns_result_without_calling_again():
+    """
+    Repeated calls are answered from the cache and do not count against max_calls.
+    """
+    calls = []
+
+    def fetch(prompt):
+        calls.append(prompt)
+        return {"text": prompt.upper()}
+
+    guard = GardeFou(max_calls=2, on_violation_duplicate_call="cache")
+    first = guard(fetch, "hi")
+    assert guard(fetch, "hi") is first
+    assert guard(fetch, "hi") is first
+    assert guard(fetch, "other") == {"text": "OTHER"}
+    assert calls == ["hi", "other"]
+    stats = guard.profile.stats()
+    assert stats["call_count"] == 2
+    assert stats["cache_hits"] == 2
+
+def test_cache_bounded_by_default():
+    cache = GardeFou(on_violation_duplicate_call="cache").profile.result_cache
+    assert cache.max_bytes == ResultCache.DEFAULT_MAX_BYTES
+    cache = GardeFou(on_violation_duplicate_call="cache", config={"cache_max_entries": 10}).profile.result_cache
+    assert (cache.max_entries, cache.max_bytes) == (10, None)
+
+def test_cache_does_not_keep_exceptions():
+    calls = []
+
+    def flaky(prompt):
+        calls.append(prompt)
+        if len(calls) == 1:
+            raise RuntimeError("provider down")
+        return "ok"
+
+    guard = GardeFou(on_violation_duplicate_call="cache")
+    with pytest.raises(RuntimeError):
+        guard(flaky, "p")
+    assert guard(flaky, "p") == "ok"
+    assert guard(flaky, "p") == "ok"
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_cache_async_returns_awaitable():
+    calls = []
+
+    async def fetch(prompt):
+        calls.append(prompt)
+        await asyncio.sleep(0)
+        return prompt * 2
+
+    guard = GardeFou(on_violation_duplicate_call="cache", config={"cache_ttl": 60})
+    assert await guard(fetch, "ab") == "abab"
+    hit = guard(fetch, "ab")
+    assert inspect.isawaitable(hit)
+    assert await hit == "abab"
+    assert calls == ["ab"]
+
+def test_disk_cache_shared_between_guards(tmp_path):
+    calls = []
+
+    def fetch(prompt):
+        calls.append(prompt)
+        return prompt.upper()
+
+    config = {"cache_dir": str(tmp_path)}
+    assert GardeFou(on_violation_duplicate_call="cache", config=config)(fetch, "hi") == "HI"
+    # a fresh guard, as in the next run of the job, reuses the stored result
+    guard = GardeFou(on_violation_duplicate_call="cache", config=config)
+    assert guard(fetch, "hi") == "HI"
+    assert calls == ["hi"]
+    assert guard.profile.stats()["cache_hits"] == 1
+
+def test_cache_cost_saved_uses_function_prices():
+    def completion(prompt):
+        return prompt
+
+    def embedding(prompt):
+        return [0.0]
+
+    guard = GardeFou(
+        on_violation_duplicate_call="cache",
+        cost={completion: 0.40, embedding: 0.0001},
+        config={"cache_policy": "gds"},
+    )
+    for _ in range(3):
+        guard(completion, "p")
+        guard(embedding, "p")
+    assert guard.profile.stats()["cache_cost_saved"] == pytest.approx(2 * 0.4001)
+
+@pytest.mark.asyncio
+async def test_cache_stale_while_revalidate(monkeypatch):
+    """
+    Past cache_stale_after the cached value is returned immediately and a
+    single background call, counted against max_calls, refreshes it; past
+    cache_ttl callers wait for a fresh call.
+    """
+    now = [0.0]
+    monkeypatch.setattr("gardefou.cache.time.monotonic", lambda: now[0])
+    version = [0]
+    release = asyncio.Event()
+
+    async def dashboard(query):
+        version[0] += 1
+        if version[0] > 1:
+            await release.wait()
+        return version[0]
+
+    guard = GardeFou(
+        max_calls=3,
+        on_violation_duplicate_call="cache",
+        config={"cache_stale_after": 10, "cache_ttl": 60},
+    )
+    assert await guard(dashboard, "q") == 1
+    now[0] = 15
+    assert await asyncio.gather(*(guard(dashboard, "q") for _ in range(20))) == [1] * 20
+    await asyncio.sleep(0)
+    assert version[0] == 2
+    assert guard.profile.call_count == 2
+    release.set()
+    while guard.profile.result_cache.get(guard.profile.signature("dashboard", ("q",), {}, fn=dashboard)) != 2:
+        await asyncio.sleep(0)
+    assert await guard(dashboard, "q") == 2
+
+    # past the hard ttl the caller waits for a fresh result
+    now[0] = 100
+    assert await guard(dashboard, "q") == 3
+    assert guard.profile.call_count == 3
+
+@pytest.mark.asyncio
+async def test_cache_stale_refresh_over_quota_keeps_serving(monkeypatch, caplog):
+    now = [0.0]
+    monkeypatch.setattr("gardefou.cache.time.monotonic", lambda: now[0])
+
+    async def fetch(query):
+        return query
+
+    guard = GardeFou(max_calls=1, on_violation_duplicate_call="cache", config={"cache_stale_after": 10})
+    assert await guard(fetch, "q") == "q"
+    now[0] = 20
+    assert await guard(fetch, "q") == "q"
+    for _ in range(3):
+        await asyncio.sleep(0)
+    assert "background refresh of fetch failed" in caplog.text
+    assert await guard(fetch, "q") == "q"
+
+def test_cache_records_and_replays_generator_stream():
+    calls = []
+
+    def stream(prompt):
+        calls.append(prompt)
+        for word in prompt.split():
+            yield word
+
+    guard = GardeFou(max_calls=5, on_violation_duplicate_call="cache")
+    first = guard(stream, "a b c")
+    assert inspect.isgenerator(first)
+    assert list(first) == ["a", "b", "c"]
+    replay = guard(stream, "a b c")
+    assert inspect.isgenerator(replay)
+    assert list(replay) == ["a", "b", "c"]
+    assert calls == ["a b c"]
+    assert guard.profile.call_count == 1
+
+def test_cache_skips_streams_read_partially():
+    calls = []
+
+    def stream(prompt):
+        calls.append(prompt)
+        yield from prompt
+
+    guard = GardeFou(on_violation_duplicate_call="cache")
+    partial = guard(stream, "abc")
+    assert next(partial) == "a"
+    partial.close()
+    assert list(guard(stream, "abc")) == ["a", "b", "c"]
+    assert list(guard(stream, "abc")) == ["a", "b", "c"]
+    assert len(calls) == 2
+
+def test_streams_not_cached_when_cache_streams_off():
+    def stream(prompt):
+        yield prompt
+
+    guard = GardeFou(max_calls=1, on_violation_duplicate_call="cache", config={"cache_streams": False})
+    assert list(guard(stream, "x")) == ["x"]
+    with pytest.raises(QuotaExceededError):
+        guard(stream, "x")
+
+def test_coalesce_does_not_share_generators():
+    def stream(prompt):
+        yield prompt
+
+    guard = GardeFou(on_violation_duplicate_call="coalesce")
+    first, second = guard(stream, "x"), guard(stream, "x")
+    assert list(first) == ["x"] and list(second) == ["x"]
+
+@pytest.mark.asyncio
+async def test_cache_records_and_replays_async_generator_stream():
+    calls = []
+
+    async def astream(prompt):
+        calls.append(prompt)
+        for token in prompt:
+            await asyncio.sleep(0)
+            yield token
+
+    guard = GardeFou(max_calls=5, on_violation_duplicate_call="cache")
+    assert [t async for t in guard(astream, "hey")] == ["h", "e", "y"]
+    replay = guard(astream, "hey")
+    assert inspect.isasyncgen(replay)
+    assert [t async for t in replay] == ["h", "e", "y"]
+    assert calls == ["hey"]
+    assert guard.profile.call_count == 1
+
+def test_rate_limit_wait_sleeps_sync_calls(monkeypatch):
+    now = [0.0]
+    slept = []
+    monkeypatch.setattr("gardefou.ratelimit.time.monotonic", lambda: now[0])
+    monkeypatch.setattr("gardefou.profile.time.sleep", slept.append)
+
+    guard = GardeFou(rate_limit="2/s", on_violation_rate_limit="wait")
+    assert [guard(add, i, 1) for i in range(5)] == [1, 2, 3, 4, 5]
+    assert slept == pytest.approx([0.5, 1.0, 1.5])
+    assert guard.profile.stats()["rate_limited_count"] == 3
+
+def test_rate_limit_wait_gives_up_after_max_wait(monkeypatch):
+    monkeypatch.setattr("gardefou.profile.time.sleep", lambda seconds: None)
+    guard = GardeFou(rate_limit="1/min", on_violation_rate_limit="wait", config={"rate_limit_max_wait": 5})
+    guard(add, 1, 1)
+    with pytest.raises(QuotaExceededError, match="rate limit exceeded"):
+        guard(add, 1, 2)
+
+@pytest.mark.asyncio
+async def test_rate_limit_wait_awaits_without_blocking_loop():
+    guard = GardeFou(rate_limit="20/s", on_violation_rate_limit="wait")
+    ticks = []
+
+    async def ticker():
+        while len(ticks) < 10:
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.01)
+
+    start = time.perf_counter()
+    results, _ = await asyncio.gather(asyncio.gather(*(guard(mul, i, 2) for i in range(24))), ticker())
+    elapsed = time.perf_counter() - start
+    assert results == [i * 2 for i in range(24)]
+    # 20 calls burst, the last 4 are spread 50ms apart
+    assert 0.15 < elapsed < 1.0
+    assert len(ticks) == 10
+
+def test_max_concurrent_threads():
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def slow(i):
+        with lock:
+            running.append(i)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(i)
+        return i
+
+    guard = GardeFou(max_concurrent=2)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert sorted(pool.map(lambda i: guard(slow, i), range(16))) == list(range(16))
+    assert max(peak) == 2
+    assert guard.profile.stats()["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_max_concurrent_coroutines_released_on_completion_and_error():
+    running = [0]
+    peak = [0]
+
+    async def slow(i):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        try:
+            await asyncio.sleep(0.001)
+            if i % 3 == 0:
+                raise RuntimeError(i)
+            return i
+        finally:
+            running[0] -= 1
+
+    guard = GardeFou(max_concurrent=3)
+    results = await asyncio.gather(*(guard(slow, i) for i in range(30)), return_exceptions=True)
+    assert peak[0] == 3
+    assert sum(isinstance(r, RuntimeError) for r in results) == 10
+    assert guard.profile.stats()["in_flight"] == 0
+
+def test_call_outcomes_sync():
+    def fail():
+        raise RuntimeError("boom")
+
+    guard = GardeFou()
+    guard(add, 1, 2)
+    with pytest.raises(RuntimeError):
+        guard(fail)
+    stats = guard.profile.stats()
+    assert (stats["completed_count"], stats["failed_count"], stats["cancelled_count"]) == (1, 1, 0)
+    assert stats["latency_max"] <= stats["latency_total"]
+
+@pytest.mark.asyncio
+async def test_call_outcomes_async_seen_when_coroutine_ends():
+    started = asyncio.Event()
+
+    async def hang():
+        started.set()
+        await asyncio.sleep(60)
+
+    async def fail():
+        await asyncio.sleep(0)
+        raise RuntimeError("boom")
+
+    guard = GardeFou()
+    pending = guard(mul, 2, 3)
+    assert guard.profile.stats()["completed_count"] == 0   # not run until awaited
+    assert await pending == 6
+    with pytest.raises(RuntimeError):
+        await guard(fail)
+    task = asyncio.ensure_future(guard(hang))
+    await started.wait()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    stats = guard.profile.stats()
+    assert (stats["completed_count"], stats["failed_count"], stats["cancelled_count"]) == (1, 1, 1)
+
+def test_refund_on_failure_sync_and_threads():
+    attempts = []
+
+    def flaky(prompt):
+        attempts.append(prompt)
+        if len(attempts) % 2:
+            raise TimeoutError(prompt)
+        return prompt
+
+    guard = GardeFou(max_calls=2, on_violation="raise", refund_on=[TimeoutError])
+    with pytest.raises(TimeoutError):
+        guard(flaky, "a")
+    assert guard(flaky, "a") == "a"      # retry is neither a duplicate nor over quota
+    assert guard.profile.call_count == 1
+
+    def fail(i):
+        raise TimeoutError(i)
+
+    guard = GardeFou(max_calls=8, refund_on=[TimeoutError])   # 8 in flight at most
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        errors = list(pool.map(lambda i: pytest.raises(TimeoutError, guard, fail, i), range(200)))
+    assert len(errors) == 200
+    stats = guard.profile.stats()
+    assert stats["call_count"] == 0
+    assert stats["refunded_count"] == stats["failed_count"] == 200
+
+@pytest.mark.asyncio
+async def test_refund_on_failure_async():
+    async def fail(prompt):
+        await asyncio.sleep(0)
+        raise TimeoutError(prompt)
+
+    async def boom(prompt):
+        raise RuntimeError(prompt)
+
+    guard = GardeFou(max_calls=2, on_violation="raise", refund_on=[TimeoutError])
+    for _ in range(5):
+        with pytest.raises(TimeoutError):
+            await guard(fail, "a")
+    with pytest.raises(RuntimeError):
+        await guard(boom, "b")              # not listed: the call still counts
+    assert await guard(mul, 2, 3) == 6
+    with pytest.raises(QuotaExceededError):
+        await guard(mul, 3, 3)
+    assert guard.profile.stats()["refunded_count"] == 5
+
+def _completion(tokens):
+    return {"usage": {"total_tokens": tokens}}
+
+def test_max_cost_commits_actual_usage():
+    guard = GardeFou(max_cost=0.05, on_violation="raise", cost=0.01, config={"cost_per_token": 0.00001})
+    guard(_completion, 2000)             # reserves 0.01, actually costs 0.02
+    guard(_completion, 100)
+    assert guard.profile.cost_spent == pytest.approx(0.021)
+    guard(_completion, 2900)
+    with pytest.raises(QuotaExceededError, match="cost budget"):
+        guard(_completion, 10)
+    assert guard.profile.cost_spent == pytest.approx(0.05)
+
+@pytest.mark.asyncio
+async def test_max_cost_async_reserves_while_in_flight_and_refunds():
+    release = asyncio.Event()
+
+    async def completion(tokens):
+        await release.wait()
+        if tokens is None:
+            raise TimeoutError()
+        return _completion(tokens)
+
+    guard = GardeFou(max_cost=0.03, on_violation="raise", cost=0.01, refund_on=[TimeoutError],
+                     config={"cost_per_token": 0.00001})
+    calls = [asyncio.ensure_future(guard(completion, t)) for t in (100, 200, None)]
+    await asyncio.sleep(0)
+    assert guard.profile.cost_spent == pytest.approx(0.03)   # three estimates in flight
+    with pytest.raises(QuotaExceededError):
+        await guard(completion, 300)
+    release.set()
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    assert isinstance(results[2], TimeoutError)
+    assert guard.profile.cost_spent == pytest.approx(0.003)
+
+def test_duplicate_message_not_built_for_large_payloads(caplog):
+    def transcribe(audio):
+        return len(audio)
+
+    audio = bytes(20 << 20)
+    guard = GardeFou(on_violation_duplicate_call="coalesce")
+    guard(transcribe, audio)
+    tracemalloc.start()
+    try:
+        guard(transcribe, audio)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < 1 << 20
+    caplog.set_level(logging.WARNING)
+    guard = GardeFou(on_violation_duplicate_call="warn")
+    guard(transcribe, audio)
+    guard(transcribe, audio)
+    assert "<bytes of 20971520 bytes>" in caplog.text
+    assert len(caplog.text) < 1000
+
+def test_max_cost_priced_by_tokens_only():
+    guard = GardeFou(max_cost=0.5, on_violation="raise", config={"cost_per_token": 1e-5})
+    guard(_completion, 20_000)           # nothing reserved up front, 0.2 committed
+    guard(_completion, 20_000)
+    assert guard.profile.cost_spent == pytest.approx(0.4)
+    guard = GardeFou(max_cost=0.5, on_violation="raise",
+                     config={"cost_per_token": 1e-5, "estimated_tokens": 30_000})
+    guard(_completion, 25_000)           # 0.3 reserved, 0.25 committed
+    with pytest.raises(QuotaExceededError, match="cost budget"):
+        guard(_completion, 1_000)        # 0.25 + 0.3 estimated is over budget
+    assert guard.profile.cost_spent == pytest.approx(0.25)
+
+def test_function_kinds_match_inspect():
+    from unittest.mock import AsyncMock
+
+    class Client:
+        def generate(self, prompt):
+            return prompt
+
+        async def agenerate(self, prompt):
+            return prompt
+
+        def stream(self, prompt):
+            yield prompt
+
+        async def astream(self, prompt):
+            yield prompt
+
+    client = Client()
+    fns = [
+        add, mul, client.generate, client.agenerate, client.stream, client.astream,
+        functools.partial(client.agenerate, "hi"), functools.partial(client.astream),
+        AsyncMock(), print, len,
+    ]
+    for fn in fns:
+        expected = (
+            "async" if inspect.iscoroutinefunction(fn)
+            else "async stream" if inspect.isasyncgenfunction(fn)
+            else "stream" if inspect.isgeneratorfunction(fn)
+            else "sync"
+        )
+        assert _kind(fn) == expected, fn
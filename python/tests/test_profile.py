@@ -12,8 +12,11 @@ TEST MATRIX for Profile initialization and behavior:
 | YAML file config | 0         | raise                  | raise                       | Zero calls allowed; raises on 1st call and 2nd dup     |
 """
 
+import asyncio
+import types
 import pytest
 import logging
+import threading
 import json
 import yaml
 from pathlib import Path
@@ -126,4 +129,239 @@ def test_no_limit_by_default():
 def test_explicit_zero_max_calls():
     p = Profile(max_calls=0, on_violation_max_calls="raise")
     with pytest.raises(QuotaExceededError):
-        p.check("z", (), {})    
\ No newline at end of file
+        p.check("z", (), {})
+
+def test_bounded_duplicate_store_from_config():
+    p = Profile(config={"on_violation_duplicate_call": "raise", "duplicate_max_entries": 2})
+    p.check("fn", (1,), {})
+    p.check("fn", (2,), {})
+    p.check("fn", (3,), {})     # evicts the (1,) signature
+    p.check("fn", (1,), {})     # no longer remembered, so not a duplicate
+    with pytest.raises(QuotaExceededError):
+        p.check("fn", (1,), {})
+    stats = p.stats()
+    assert stats["signatures"] == 2
+    assert stats["evictions"] == 2
+    assert stats["duplicate_count"] == 1
+
+def test_probabilistic_duplicate_detection():
+    p = Profile(on_violation_duplicate_call="raise", duplicate_detection="probabilistic")
+    p.check("fn", ("a",), {})
+    p.check("fn", ("b",), {})
+    with pytest.raises(QuotaExceededError):
+        p.check("fn", ("a",), {})
+    stats = p.stats()
+    assert stats["signatures"] == 2
+    assert "estimated_fpr" in stats and "fill_ratio" in stats
+
+def test_unknown_duplicate_detection_mode():
+    with pytest.raises(ValueError):
+        Profile(duplicate_detection="fuzzy")
+
+def test_near_duplicate_routes_to_duplicate_handler(caplog):
+    caplog.set_level(logging.WARNING)
+    prompt = "Summarize the attached incident report for the on-call team and list follow-ups. Sent at {}"
+    p = Profile(config={"near_duplicate_threshold": 0.7, "on_violation_duplicate_call": "warn"})
+    p.check("ask", (prompt.format("09:15:02"),), {})
+    p.check("ask", (prompt.format("09:15:47"),), {})
+    assert "near-duplicate call detected" in caplog.text
+    assert p.stats()["duplicate_count"] == 1
+
+def test_dedup_ignore_skips_irrelevant_arguments():
+    p = Profile(on_violation_duplicate_call="raise", dedup_ignore=["request_id", 1])
+    p.check("ask", ("hello", object()), {"request_id": 1})
+    with pytest.raises(QuotaExceededError):
+        p.check("ask", ("hello", object()), {"request_id": 2})
+
+def test_dedup_key_selects_compared_value():
+    p = Profile(on_violation_duplicate_call="raise", dedup_key=lambda prompt, **kw: prompt.strip())
+    p.check("ask", ("hello",), {"temperature": 0.1})
+    p.check("ask", ("world",), {"temperature": 0.1})
+    with pytest.raises(QuotaExceededError):
+        p.check("ask", ("hello  ",), {"temperature": 0.9})
+
+def test_fingerprint_file_contents_catches_renamed_upload(tmp_path):
+    first, renamed = tmp_path / "a.wav", tmp_path / "b.wav"
+    first.write_bytes(b"RIFF audio")
+    renamed.write_bytes(b"RIFF audio")
+    p = Profile(config={"on_violation_duplicate_call": "raise", "fingerprint_file_contents": True})
+    p.check("transcribe", (first,), {})
+    with pytest.raises(QuotaExceededError):
+        p.check("transcribe", (renamed,), {})
+
+def test_concurrent_checks_do_not_overshoot_or_miss():
+    violations = []
+    p = Profile(max_calls=1000, on_violation_max_calls=lambda prof: violations.append("max"),
+                on_violation_duplicate_call=lambda prof: violations.append("dup"))
+
+    def worker():
+        for i in range(100):
+            p.check("fn", (i,), {})
+
+    threads = [threading.Thread(target=worker) for _ in range(32)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert p.call_count == 3200
+    assert violations.count("max") == 3200 - 1000
+    assert violations.count("dup") == p.duplicate_count == 3200 - 100
+
+def test_duplicate_window_seconds(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("gardefou.storage.time.monotonic", lambda: now[0])
+    p = Profile(on_violation_duplicate_call="raise", duplicate_window_seconds=60)
+    p.check("fn", ("prompt",), {})
+    now[0] += 30
+    with pytest.raises(QuotaExceededError):
+        p.check("fn", ("prompt",), {})
+    now[0] += 3600
+    p.check("fn", ("prompt",), {})   # an hour later is legitimate
+
+def test_duplicate_window_requires_exact_mode():
+    with pytest.raises(ValueError):
+        Profile(duplicate_window_seconds=60, duplicate_detection="probabilistic")
+
+def test_call_cost_from_number_dict_or_callable():
+    def chat():
+        pass
+
+    class Client:
+        def create(self):
+            pass
+
+    assert Profile().call_cost(chat) == 1.0
+    assert Profile(cost=0.01).call_cost(chat) == 0.01
+    priced = Profile(cost={chat: 0.4, Client.create: 0.2})
+    assert priced.call_cost(chat) == 0.4
+    assert priced.call_cost(Client().create) == 0.2
+    assert priced.call_cost(print) == 0.0
+    by_usage = Profile(cost=lambda fn, args, kwargs, result: len(result) * 0.001)
+    assert by_usage.call_cost(chat, result="abc") == pytest.approx(0.003)
+
+def test_rate_limit_handler(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("gardefou.ratelimit.time.monotonic", lambda: now[0])
+    profile = Profile(rate_limit="2/min", on_violation_rate_limit="raise")
+    profile.check("f", (1,), {})
+    profile.check("f", (2,), {})
+    with pytest.raises(QuotaExceededError, match="rate limit exceeded"):
+        profile.check("f", (3,), {})
+    now[0] = 30
+    profile.check("f", (4,), {})
+    assert profile.stats()["rate_limited_count"] == 1
+
+def test_rate_limit_from_shipped_config():
+    profile = Profile(config=Path(__file__).parent.parent / "gardefou.config.json", on_violation="warn")
+    assert profile.rate_limit == "10/min"
+    assert profile._rate_limiter.windows == [(10, 60.0)]
+
+def test_rate_limit_windows_list(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("gardefou.ratelimit.time.monotonic", lambda: now[0])
+    profile = Profile(config={"rate_limit": ["2/s", "3/min"], "on_violation_rate_limit": "raise"})
+    profile.check("f")
+    profile.check("f")
+    now[0] = 1
+    profile.check("f")
+    now[0] = 2
+    with pytest.raises(QuotaExceededError, match=r"2/s, 3/min"):
+        profile.check("f")
+
+def test_refund_gives_back_reservation_and_signature():
+    p = Profile(max_calls=1, on_violation="raise", refund_on=[TimeoutError])
+    signature = p.signature("f", (1,), {})
+    p.check("f", (1,), {}, signature=signature)
+    p.call_finished(p.call_started(), TimeoutError(), signature)
+    p.check("f", (1,), {}, signature=signature)    # retry: neither over quota nor a duplicate
+    p.call_finished(p.call_started(), ValueError(), signature)
+    with pytest.raises(QuotaExceededError):
+        p.check("f", (2,), {})
+    assert p.stats()["refunded_count"] == 1
+
+def test_rejected_call_keeps_no_reservation():
+    p = Profile(max_calls=2, on_violation="raise", on_violation_duplicate_call="raise")
+    p.check("f", (1,), {})
+    with pytest.raises(QuotaExceededError, match="duplicate"):
+        p.check("f", (1,), {})
+    p.check("f", (2,), {})
+    with pytest.raises(QuotaExceededError, match="quota"):
+        p.check("f", (3,), {})
+    assert p.call_count == 2
+
+def test_rejected_call_gives_back_rate_limit_slot(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("gardefou.ratelimit.time.monotonic", lambda: now[0])
+    p = Profile(rate_limit="2/min", on_violation_rate_limit="raise", on_violation_duplicate_call="raise")
+    p.check("f", (1,), {})
+    with pytest.raises(QuotaExceededError, match="duplicate"):
+        p.check("f", (1,), {})
+    p.check("f", (2,), {})
+    with pytest.raises(QuotaExceededError, match="rate limit exceeded"):
+        p.check("f", (3,), {})
+
+def test_rejected_call_gives_back_booked_slot(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("gardefou.ratelimit.time.monotonic", lambda: now[0])
+    p = Profile(rate_limit="1/s", on_violation_rate_limit="wait", on_violation_duplicate_call="raise")
+    assert p.check("f", (1,), {}, block=False) == 0.0
+    with pytest.raises(QuotaExceededError, match="duplicate"):
+        p.check("f", (1,), {}, block=False)
+    assert p.check("f", (2,), {}, block=False) == pytest.approx(1.0)
+
+def test_refund_on_names_from_config():
+    p = Profile(config={"refund_on": ["TimeoutError", "asyncio.CancelledError"]})
+    assert p.refund_on == (TimeoutError, asyncio.CancelledError)
+    with pytest.raises(ValueError):
+        Profile(refund_on=["NoSuchError"])
+    with pytest.raises(ValueError):
+        Profile(refund_on=[int])
+
+def test_max_cost_reserves_estimate_from_price_table():
+    def cheap():
+        pass
+
+    def pricey():
+        pass
+
+    p = Profile(max_cost=1.0, on_violation="raise", cost={cheap: 0.001, pricey: 0.4})
+    p.check("pricey", fn=pricey)
+    p.check("pricey", fn=pricey)
+    with pytest.raises(QuotaExceededError, match="cost budget exceeded"):
+        p.check("pricey", fn=pricey)
+    for _ in range(100):
+        p.check("cheap", fn=cheap)
+    assert p.stats()["cost_spent"] == pytest.approx(0.9)
+
+def test_commit_reconciles_token_usage():
+    def chat():
+        pass
+
+    response = types.SimpleNamespace(usage=types.SimpleNamespace(total_tokens=1200))
+    p = Profile(max_cost=1.0, cost=0.01, config={"cost_per_token": {chat: 0.00001}})
+    p.check("chat", fn=chat)
+    assert p.commit(0.01, chat, result=response) == pytest.approx(0.012)
+    assert p.commit(0.0, chat, result={"usage": {"total_tokens": 500}}) == pytest.approx(0.005)
+    assert p.commit(0.01, chat, result="no usage") == 0.01
+    assert p.cost_spent == pytest.approx(0.017)
+
+def test_near_duplicates_follow_duplicate_window(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("gardefou.storage.time.monotonic", lambda: now[0])
+    monkeypatch.setattr("gardefou.similarity.time.monotonic", lambda: now[0])
+    p = Profile(on_violation_duplicate_call="raise",
+                config={"duplicate_window_seconds": 60, "near_duplicate_threshold": 0.8})
+    p.check("ask", ("Summarize the incident report, sent at 09:15:02",), {})
+    now[0] += 3600
+    p.check("ask", ("Summarize the incident report, sent at 09:15:02",), {})   # an hour later is legitimate
+
+def test_refund_forgets_near_duplicate_text():
+    prompt = ("Summarize the attached incident report for the on-call team.",)
+    p = Profile(on_violation_duplicate_call="raise", refund_on=[TimeoutError],
+                config={"near_duplicate_threshold": 0.9})
+    signature = p.signature("ask", prompt, {})
+    p.check("ask", prompt, {}, signature=signature)
+    p.call_finished(p.call_started(), TimeoutError(), signature)
+    p.check("ask", prompt, {}, signature=signature)     # the retry is not a near-duplicate either
+    assert p.duplicate_count == 0
+
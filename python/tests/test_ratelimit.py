@@ -0,0 +1,113 @@
+"""
+TEST MATRIX for rate limiting:
+
+| Scenario          | rate        | Expected Behavior                                      |
+|-------------------|-------------|--------------------------------------------------------|
+| Parsing           | "10/min"... | (count, seconds); bad units and zero counts rejected   |
+| Burst             | "3/s"       | 3 calls at once allowed, 4th told how long to wait     |
+| Steady rate       | "2/s"       | One more call allowed every 0.5s                       |
+| Rejection         | "1/min"     | A rejected call does not consume capacity              |
+| Multiple windows  | 2/s + 3/min | Tightest window wins; a rejection debits no window     |
+| Reserve, windows  | 2/s + 3/min | Booked slot satisfies every window                     |
+| Refund            | 2/s + 3/min | Capacity of an unmade call goes back to every window   |
+"""
+
+import pytest
+
+from gardefou.ratelimit import RateLimiter, parse_rate
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.parametrize(
+    "rate, expected",
+    [("10/s", (10, 1.0)), ("10/min", (10, 60.0)), ("5/h", (5, 3600.0)), ("100/day", (100, 86400.0)),
+     (" 3 / minutes ", (3, 60.0))],
+)
+def test_parse_rate(rate, expected):
+    assert parse_rate(rate) == expected
+
+@pytest.mark.parametrize("rate", ["10", "10/week", "0/s", "ten/s", "-1/s"])
+def test_parse_rate_rejects(rate):
+    with pytest.raises(ValueError):
+        parse_rate(rate)
+
+def test_burst_then_wait():
+    clock = FakeClock()
+    limiter = RateLimiter("3/s", clock=clock)
+    assert [limiter.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire() == pytest.approx(1 / 3)
+
+def test_steady_rate():
+    clock = FakeClock()
+    limiter = RateLimiter("2/s", clock=clock)
+    limiter.acquire()
+    limiter.acquire()
+    assert limiter.acquire() == pytest.approx(0.5)
+    clock.now = 0.5
+    assert limiter.acquire() == 0.0
+    assert limiter.acquire() > 0
+
+def test_rejected_call_takes_no_capacity():
+    clock = FakeClock()
+    limiter = RateLimiter("1/min", clock=clock)
+    assert limiter.acquire() == 0.0
+    for _ in range(100):
+        assert limiter.acquire() > 0
+    clock.now = 60
+    assert limiter.acquire() == 0.0
+
+def test_multiple_windows_all_enforced():
+    clock = FakeClock()
+    limiter = RateLimiter(["2/s", "3/min"], clock=clock)
+    assert limiter.acquire() == 0.0
+    assert limiter.acquire() == 0.0
+    # per-second window full
+    assert limiter.acquire() == pytest.approx(0.5)
+    clock.now = 1
+    assert limiter.acquire() == 0.0
+    # per-minute window full: next call once the first minute slot frees up
+    clock.now = 2
+    assert limiter.acquire() == pytest.approx(18)
+
+def test_rejection_by_one_window_debits_none():
+    clock = FakeClock()
+    limiter = RateLimiter(["1/s", "100/day"], clock=clock)
+    limiter.acquire()
+    for _ in range(500):
+        assert limiter.acquire() > 0
+    clock.now = 1
+    # the daily window was not charged for the 500 rejected calls
+    assert limiter.acquire() == 0.0
+    assert limiter._tats[1] == pytest.approx(2 * 864)
+
+def test_reserve_books_slot_valid_for_every_window():
+    clock = FakeClock()
+    limiter = RateLimiter(["2/s", "3/min"], clock=clock)
+    delays = [limiter.reserve() for _ in range(5)]
+    assert delays == pytest.approx([0, 0, 0.5, 20, 40])
+    assert limiter.reserve(max_wait=30) is None
+    assert limiter.reserve() == pytest.approx(60)
+
+def test_refund_gives_back_capacity_to_every_window():
+    clock = FakeClock()
+    limiter = RateLimiter(["2/s", "3/min"], clock=clock)
+    assert limiter.reserve() == 0.0
+    assert limiter.reserve() == 0.0
+    limiter.refund()
+    assert limiter.reserve() == 0.0
+    assert limiter.reserve() == pytest.approx(0.5)
+    limiter.refund()
+    clock.now = 1
+    assert limiter.acquire() == 0.0
+    assert limiter.acquire() > 0
+
+def test_empty_window_list_rejected():
+    with pytest.raises(ValueError):
+        RateLimiter([])
@@ -0,0 +1,97 @@
+"""
+TEST MATRIX for the semantic result cache (skipped without numpy):
+
+| Scenario                   | Setup                               | Expected Behavior                               |
+|----------------------------|-------------------------------------|-------------------------------------------------|
+| Paraphrase                 | threshold=0.8                       | Close embedding is a hit, distant one a miss    |
+| Scopes                     | same text, different scope          | Results never cross scopes                      |
+| Growth                     | initial_capacity=2, 10 puts         | Matrix grows, every entry still found           |
+| Ring                       | max_entries=3                       | Oldest entries overwritten                      |
+| GardeFou cache mode        | semantic_embedding=embed            | Paraphrased call answered without calling fn    |
+| Expiry                     | cache_ttl=60, fake clock            | Semantic match stops once the entry expires     |
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from gardefou import GardeFou
+from gardefou.semantic import SemanticCache
+
+VOCAB = ["capital", "france", "paris", "weather", "tomorrow", "what", "is", "the", "of", "tell", "me"]
+
+
+def bag_of_words(text):
+    words = text.lower().replace("?", "").split()
+    return [float(words.count(w)) for w in VOCAB]
+
+
+def test_close_embedding_hits_distant_misses():
+    cache = SemanticCache(bag_of_words, threshold=0.8)
+    query = cache.embed("what is the capital of france")
+    cache.put("chat", query, "Paris")
+    assert cache.lookup("chat", cache.embed("tell me what is the capital of france?")) == (True, "Paris")
+    assert cache.lookup("chat", cache.embed("weather tomorrow")) == (False, None)
+    assert cache.stats()["semantic_hits"] == 1
+
+def test_scopes_are_separate():
+    cache = SemanticCache(bag_of_words)
+    vector = cache.embed("capital of france")
+    cache.put("chat", vector, "chat result")
+    assert cache.lookup("embeddings", vector) == (False, None)
+    cache.put("embeddings", vector, "embedding result")
+    assert cache.lookup("chat", vector) == (True, "chat result")
+    assert cache.lookup("embeddings", vector) == (True, "embedding result")
+
+def test_matrix_grows_from_initial_capacity():
+    cache = SemanticCache(lambda text: np.eye(16)[int(text)], initial_capacity=2)
+    for i in range(10):
+        cache.put("f", cache.embed(str(i)), i)
+    assert len(cache) == 10
+    assert all(cache.lookup("f", cache.embed(str(i))) == (True, i) for i in range(10))
+
+def test_max_entries_overwrites_oldest():
+    cache = SemanticCache(lambda text: np.eye(16)[int(text)], max_entries=3)
+    for i in range(5):
+        cache.put("f", cache.embed(str(i)), i)
+    assert len(cache) == 3
+    assert cache.lookup("f", cache.embed("0")) == (False, None)
+    assert cache.lookup("f", cache.embed("4")) == (True, 4)
+    assert cache.stats()["semantic_evictions"] == 2
+
+def test_guard_answers_paraphrase_from_cache():
+    calls = []
+
+    def ask(prompt):
+        calls.append(prompt)
+        return "Paris"
+
+    guard = GardeFou(
+        on_violation_duplicate_call="cache",
+        config={"semantic_embedding": bag_of_words, "semantic_threshold": 0.8},
+    )
+    assert guard(ask, "what is the capital of france") == "Paris"
+    assert guard(ask, "tell me what is the capital of france?") == "Paris"
+    assert guard(ask, "weather tomorrow") == "Paris"
+    assert calls == ["what is the capital of france", "weather tomorrow"]
+    assert guard.profile.stats()["semantic_hits"] == 1
+
+def test_semantic_entries_expire_with_cache_ttl(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("gardefou.cache.time.monotonic", lambda: now[0])
+    monkeypatch.setattr("gardefou.semantic.time.monotonic", lambda: now[0])
+    calls = []
+
+    def ask(prompt):
+        calls.append(prompt)
+        return len(calls)
+
+    guard = GardeFou(on_violation_duplicate_call="cache",
+                     config={"cache_ttl": 60, "semantic_embedding": bag_of_words, "semantic_threshold": 0.8})
+    assert guard(ask, "what is the capital of france") == 1
+    now[0] = 30
+    assert guard(ask, "tell me what is the capital of france?") == 1
+    now[0] = 61
+    assert guard(ask, "what is the capital of france") == 2
+    assert guard.profile.semantic_cache.max_entries == SemanticCache.DEFAULT_MAX_ENTRIES
+
@@ -0,0 +1,76 @@
+"""
+TEST MATRIX for near-duplicate detection:
+
+| Scenario                                   | Expected Behavior                    |
+|--------------------------------------------|--------------------------------------|
+| Strings nested in args / messages          | All extracted in order               |
+| Same prompt, different timestamp           | Matched above threshold              |
+| Same prompt, extra trailing whitespace     | Matched (whitespace is normalized)   |
+| Unrelated prompt                           | Not matched                          |
+| Same text under another scope              | Not matched                          |
+| max_entries=2                              | Oldest entry evicted                 |
+| ttl=60                                     | Text forgotten 60s after last match  |
+| discard(key)                               | Text added under key forgotten       |
+"""
+
+from gardefou.similarity import MinHashLSH, extract_text
+
+PROMPT = (
+    "You are a helpful assistant. Summarize the following quarterly report for the "
+    "finance team, highlighting revenue, churn and the outlook for next quarter. "
+    "Report generated at 2025-07-19 10:42:17 UTC."
+)
+
+
+def test_extract_text_walks_nested_arguments():
+    messages = [{"role": "system", "content": "be brief"}, {"role": "user", "content": "hi"}]
+    text = extract_text((messages,), {"model": "gpt-4", "temperature": 0.2})
+    assert text.split("\n") == ["system", "be brief", "user", "hi", "gpt-4"]
+
+def test_timestamp_change_is_near_duplicate():
+    index = MinHashLSH(threshold=0.8)
+    assert index.check_and_add("f", PROMPT) is None
+    similarity = index.check_and_add("f", PROMPT.replace("10:42:17", "10:43:05"))
+    assert similarity is not None and similarity >= 0.8
+
+def test_trailing_whitespace_is_normalized():
+    index = MinHashLSH(threshold=0.95)
+    index.check_and_add("f", PROMPT)
+    assert index.check_and_add("f", PROMPT + "  \n") == 1.0
+
+def test_unrelated_text_and_other_scope_do_not_match():
+    index = MinHashLSH(threshold=0.8)
+    index.check_and_add("f", PROMPT)
+    assert index.check_and_add("f", "Translate this sentence into French, please.") is None
+    assert index.check_and_add("g", PROMPT) is None
+    assert index.stats()["near_duplicate_matches"] == 0
+
+def test_max_entries_evicts_oldest():
+    index = MinHashLSH(threshold=0.9, max_entries=2)
+    index.check_and_add("f", "first prompt about apples and pears")
+    index.check_and_add("f", "second prompt about trains and planes")
+    index.check_and_add("f", "third prompt about rivers and lakes")
+    assert len(index) == 2
+    assert index.check_and_add("f", "first prompt about apples and pears") is None
+
+def test_ttl_forgets_texts():
+    now = [0.0]
+    index = MinHashLSH(threshold=0.9, ttl=60, clock=lambda: now[0])
+    index.check_and_add("f", PROMPT)
+    now[0] = 50
+    assert index.check_and_add("f", PROMPT) == 1.0      # matched: TTL restarts
+    now[0] = 100
+    assert index.check_and_add("f", PROMPT) == 1.0
+    now[0] = 170
+    assert index.check_and_add("f", PROMPT) is None
+    assert index.stats()["near_duplicate_expirations"] == 1
+    assert len(index) == 1
+
+def test_discard_forgets_text_added_under_key():
+    index = MinHashLSH(threshold=0.9)
+    index.check_and_add("f", PROMPT, key=b"call-1")
+    assert index.discard(b"call-1") is True
+    assert index.discard(b"call-1") is False
+    assert index.check_and_add("f", PROMPT) is None
+    assert len(index) == 1
+
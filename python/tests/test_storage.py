@@ -0,0 +1,163 @@
+"""
+TEST MATRIX for duplicate-signature stores:
+
+| Store          | limits                  | Expected Behavior                                   |
+|----------------|-------------------------|-----------------------------------------------------|
+| SignatureStore | none                    | Behaves like a set, never evicts                    |
+| SignatureStore | max_entries=2           | Least recently seen signature is evicted first      |
+| SignatureStore | max_bytes               | Evicts until retained size fits the budget          |
+| SignatureStore | ttl=10                  | Signature forgotten 10s after it was last seen      |
+| Bloom store    | error_rate=0.01         | No missed duplicates, FPR near target, grows        |
+| Bloom store    | max_bytes=4096          | Never exceeds budget, reports rising FPR            |
+| Sharded store  | shards=4                | Same key, same shard; stats combined                |
+| Sharded store  | 16 threads              | Each key reported new exactly once                  |
+| Windowed store | window=10, buckets=5    | Repeats count only within the window                |
+| Any store      | discard                 | Forgotten key is new again (Bloom cannot forget)    |
+"""
+
+import hashlib
+import threading
+
+from gardefou.storage import BloomSignatureStore, ShardedSignatureStore, SignatureStore, WindowedSignatureStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_unbounded_store_acts_like_set():
+    store = SignatureStore()
+    assert store.check_and_add("a") is False
+    assert store.check_and_add("a") is True
+    assert "a" in store
+    assert store.stats()["evictions"] == 0
+
+def test_max_entries_evicts_least_recently_seen():
+    store = SignatureStore(max_entries=2)
+    store.check_and_add("a")
+    store.check_and_add("b")
+    store.check_and_add("a")      # refresh "a", so "b" is now the oldest
+    store.check_and_add("c")
+    assert "a" in store and "c" in store
+    assert "b" not in store
+    assert store.stats()["evictions"] == 1
+
+def test_max_bytes_bounds_retained_size():
+    store = SignatureStore(max_bytes=1000)
+    for i in range(100):
+        store.check_and_add(("fn", "x" * 100 + str(i)))
+    stats = store.stats()
+    assert stats["signature_bytes"] <= 1000
+    assert stats["evictions"] == 100 - len(store)
+
+def test_ttl_expires_entries():
+    clock = FakeClock()
+    store = SignatureStore(ttl=10, clock=clock)
+    store.check_and_add("a")
+    clock.now = 5
+    assert store.check_and_add("a") is True   # seen again, TTL restarts
+    clock.now = 14
+    assert "a" in store
+    clock.now = 15
+    assert "a" not in store
+    assert store.stats()["expirations"] == 1
+
+def _digest(i):
+    return hashlib.blake2b(str(i).encode(), digest_size=16).digest()
+
+def test_bloom_store_never_misses_duplicates():
+    store = BloomSignatureStore(error_rate=0.01, initial_capacity=100)
+    for i in range(1000):
+        store.check_and_add(_digest(i))
+    assert all(_digest(i) in store for i in range(1000))
+    stats = store.stats()
+    assert stats["filters"] > 1
+    assert 0 < stats["fill_ratio"] < 1
+    assert stats["estimated_fpr"] < 0.05
+
+def test_bloom_store_false_positive_rate_near_target():
+    store = BloomSignatureStore(error_rate=0.01, initial_capacity=1000)
+    for i in range(5000):
+        store.check_and_add(_digest(i))
+    false_positives = sum(_digest(i) in store for i in range(5000, 25000))
+    assert false_positives / 20000 < 0.02
+
+def test_bloom_store_respects_byte_budget():
+    store = BloomSignatureStore(error_rate=0.01, max_bytes=4096, initial_capacity=1000)
+    for i in range(20000):
+        store.check_and_add(_digest(i))
+    stats = store.stats()
+    assert stats["signature_bytes"] <= 4096
+    assert stats["saturated"] is True
+    assert stats["estimated_fpr"] > 0.01
+
+def test_sharded_store_routes_keys_consistently():
+    store = ShardedSignatureStore(lambda: SignatureStore(max_entries=10), shards=4)
+    keys = [_digest(i) for i in range(20)]
+    assert not any(store.check_and_add(k) for k in keys)
+    assert all(store.check_and_add(k) for k in keys)
+    stats = store.stats()
+    assert stats["shards"] == 4
+    assert stats["signatures"] == len(store) == 20
+
+def test_sharded_store_is_atomic_under_threads():
+    store = ShardedSignatureStore(SignatureStore, shards=8)
+    keys = [_digest(i) for i in range(200)]
+    first_seen = []
+
+    def worker():
+        for k in keys:
+            if not store.check_and_add(k):
+                first_seen.append(k)
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(first_seen) == sorted(keys)
+
+def test_windowed_store_forgets_after_window():
+    clock = FakeClock()
+    store = WindowedSignatureStore(10, buckets=5, clock=clock)
+    store.check_and_add("a")
+    clock.now = 9.9
+    assert store.check_and_add("b") is False
+    assert "a" in store
+    clock.now = 12.5          # "a" is older than the window and its slot is gone
+    assert "a" not in store
+    assert "b" in store
+    assert store.stats()["expirations"] == 1
+
+def test_windowed_store_repeat_restarts_window():
+    clock = FakeClock()
+    store = WindowedSignatureStore(10, buckets=5, clock=clock)
+    store.check_and_add("a")
+    clock.now = 8
+    assert store.check_and_add("a") is True
+    clock.now = 17
+    assert store.check_and_add("a") is True
+    clock.now = 40
+    assert store.check_and_add("a") is False
+    assert len(store) == 1
+
+def test_discard_forgets_signature():
+    digest = _digest(1)
+    for store in (SignatureStore(), WindowedSignatureStore(10), ShardedSignatureStore(SignatureStore, 4)):
+        store.check_and_add(digest)
+        assert store.discard(digest) is True
+        assert store.discard(digest) is False
+        assert store.check_and_add(digest) is False
+    store = SignatureStore()
+    store.check_and_add(digest)
+    store.discard(digest)
+    assert store.stats()["signature_bytes"] == 0
+    bloom = BloomSignatureStore()
+    bloom.check_and_add(digest)
+    assert bloom.discard(digest) is False
+    assert digest in bloom
+